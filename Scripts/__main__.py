@@ -0,0 +1,168 @@
+import argparse, json, sys, timeit
+
+# Headless entry point: python -m Scripts {generate, detect, analyze, cache} ...
+# Only the module needed by the chosen command is imported, none of them loads PyQt, Tk or matplotlib
+
+def parse_range(value, cast=float):
+    low, high = value.split(",")
+    return (cast(low), cast(high))
+
+def run_generate(args):
+    from Scripts.generator import GeneratorConfig, generate_dataset
+    config = GeneratorConfig(num_circ=args.num_circ,
+                             num_images=args.num_images,
+                             randomness=args.randomness,
+                             range_radius=parse_range(args.range_radius),
+                             range_points=parse_range(args.range_points, int),
+                             noise_ratio=args.noise_ratio,
+                             known_data=not args.unknown,
+                             dataset_format=args.format,
+                             workers=args.workers,
+                             seed=args.seed)
+    generate_dataset(args.output, config)
+    print(f"Dataset saved in {args.output}")
+
+def run_detect(args):
+    from Scripts.detection import DetectionConfig, save_detection
+    from Scripts.results_io import get_writer, resume_writer
+    config = DetectionConfig(fuzziness_range=parse_range(args.fuzziness_range),
+                             attempts=args.attempts,
+                             max_iterations=args.max_iter,
+                             membership_threshold=args.threshold,
+                             data_known=not args.unknown,
+                             num_circles=args.num_circles,
+                             precision=args.precision,
+                             chunk_size=args.chunk_size,
+                             batched=not args.sequential,
+                             workers=args.workers,
+                             seed=args.seed,
+                             tolerance=args.tolerance,
+                             objective_tolerance=args.objective_tolerance,
+                             seeding=args.seeding,
+                             method=args.method,
+                             noise_distance=args.noise_distance,
+                             k_range=parse_range(args.k_range, int) if args.k_range else None,
+                             validity=args.validity,
+                             prefilter_neighbors=args.prefilter_neighbors,
+                             prefilter_factor=args.prefilter_factor,
+                             batch_size=args.batch_size,
+                             radius_range=parse_range(args.radius_range),
+                             hough_cell=args.hough_cell,
+                             hough_levels=args.hough_levels,
+                             ransac_hypotheses=args.ransac_hypotheses,
+                             inlier_threshold=args.inlier_threshold,
+                             ransac_min_support=args.ransac_min_support,
+                             time_budget=args.time_budget,
+                             racing=args.racing,
+                             racing_budget=args.racing_budget,
+                             racing_eta=args.racing_eta,
+                             cache_dir=args.cache,
+                             cache_size=int(args.cache_size * 2**20),
+                             profile=args.profile,
+                             profile_dir=args.profile_dir or f"{args.output}/profiles")
+    start = timeit.default_timer()
+    writer = resume_writer(args.resume) if args.resume else get_writer(args.output, args.format)
+    report, metrics_path = save_detection(args.dataset, config, writer, args.metrics)
+    if report.cache is not None:
+        print(f"Cache: {report.cache['hits']} hits, {report.cache['misses']} misses, {report.cache['evictions']} evicted")
+    print(f"Results saved in {writer.path}\nMetrics saved in {metrics_path}\nTook {(timeit.default_timer()-start):.2f} seconds")
+
+def run_cache(args):
+    from Scripts.cache import DetectionCache
+    cache = DetectionCache(args.cache, 0)
+    if args.clear:
+        cache.clear()
+        print(f"Cache {args.cache} cleared")
+        return
+    entries = cache.entries()
+    stats = cache.stats()
+    lookups = stats["hits"] + stats["misses"]
+    print(f"Entries: {len(entries)}\nSize: {sum(size for _, size, _ in entries) / 2**20:.2f} MB\n"
+          f"Hits: {stats['hits']}\nMisses: {stats['misses']}\nEvictions: {stats['evictions']}\n"
+          f"Hit rate: {stats['hits'] / lookups if lookups else 0.0:.2%}")
+
+def run_analyze(args):
+    from Scripts.analysis import extract_stats
+    from Scripts.results_io import load_results
+    results = load_results(args.results)
+    # Results of unknown data have no real rings, so there is no error to analyze (the GUI refuses them too)
+    if any("tot_error" not in entry for clouds in results.values() for entry in clouds.values()):
+        sys.exit(f"These results cannot be analyzed, they were detected on unknown data (no tot_error):\n{args.results}")
+    json.dump(extract_stats(results), sys.stdout, indent=4)
+    print()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m Scripts", description="Generate, detect and analyze clouds of noisy rings")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    generate_parser = commands.add_parser("generate", help="Generate a dataset of instances")
+    generate_parser.add_argument("output", help="Directory in which the instances will be saved")
+    generate_parser.add_argument("--num-circ", type=int, default=3, help="Number of circumferences per instance")
+    generate_parser.add_argument("--num-images", type=int, default=10, help="Number of instances per type of instance")
+    generate_parser.add_argument("--randomness", type=float, default=1.0, help="Randomness of the points of a circumference")
+    generate_parser.add_argument("--range-radius", default="5.0,15.0", help="Range of the radii, as min,max")
+    generate_parser.add_argument("--range-points", default="100,150", help="Range of the number of points of a circumference, as min,max")
+    generate_parser.add_argument("--noise-ratio", type=float, default=0.05, help="Noise points per circumference point")
+    generate_parser.add_argument("--unknown", action="store_true", help="Do not include the real centers and radii")
+    generate_parser.add_argument("--format", choices=["csv", "npy"], default="csv", help="Semicolon separated csv files or memory-mappable .npy arrays")
+    generate_parser.add_argument("--workers", type=int, default=1, help="Number of worker processes, 0 uses every core")
+    generate_parser.add_argument("--seed", type=int, default=None, help="Master seed, the same seed gives the same dataset with any number of workers")
+    generate_parser.set_defaults(run=run_generate)
+
+    detect_parser = commands.add_parser("detect", help="Detect the rings of a dataset")
+    detect_parser.add_argument("dataset", help="Directory where the instances are located")
+    detect_parser.add_argument("output", nargs="?", default="./results", help="Directory where the results will be saved")
+    detect_parser.add_argument("--fuzziness-range", default="1.05,2.0", help="Range of the fuzziness of each attempt, as min,max")
+    detect_parser.add_argument("--attempts", type=int, default=40, help="Attempts per instance when the data is known")
+    detect_parser.add_argument("--max-iter", type=int, default=100, help="Maximum number of iterations of an attempt")
+    detect_parser.add_argument("--threshold", type=float, default=0.3, help="Minimum membership of a point used to estimate a radius")
+    detect_parser.add_argument("--unknown", action="store_true", help="The instances do not include the real centers and radii")
+    detect_parser.add_argument("--num-circles", type=int, default=3, help="Number of circumferences to look for when the data is unknown")
+    detect_parser.add_argument("--precision", choices=["float64", "float32"], default="float64")
+    detect_parser.add_argument("--chunk-size", type=int, default=None, help="Number of points per chunk of the membership update")
+    detect_parser.add_argument("--sequential", action="store_true", help="Run the attempts one after another instead of batched")
+    detect_parser.add_argument("--workers", type=int, default=1, help="Number of worker processes, 0 uses every core")
+    detect_parser.add_argument("--seed", type=int, default=None)
+    detect_parser.add_argument("--tolerance", type=float, default=1e-6, help="Center shift under which an attempt has converged")
+    detect_parser.add_argument("--objective-tolerance", type=float, default=None, help="Relative objective change under which an attempt has converged")
+    detect_parser.add_argument("--seeding", choices=["uniform", "kmeans++", "density"], default="uniform")
+    detect_parser.add_argument("--method", choices=["fcm", "shells", "minibatch", "hough", "ransac"], default=None, help="Fuzzy c-means on the centers, fuzzy c-shells fitting a center and a radius per ring, fuzzy c-means on random batches of points, a Hough transform, or RANSAC circle fitting (default fcm, or shells with --k-range)")
+    detect_parser.add_argument("--batch-size", type=int, default=1024, help="Points per iteration of the minibatch method")
+    detect_parser.add_argument("--noise-distance", type=float, default=5.0, help="Distance of the noise prototype of the shells method")
+    detect_parser.add_argument("--radius-range", default="1.0,50.0", help="Radii searched by the hough and ransac methods, as min,max")
+    detect_parser.add_argument("--hough-cell", type=float, default=2.0, help="Size of the coarse center cells of the hough method")
+    detect_parser.add_argument("--hough-levels", type=int, default=3, help="Coarse to fine levels of the hough method")
+    detect_parser.add_argument("--ransac-hypotheses", type=int, default=4096, help="Circles through 3 random points tried per ring by the ransac method")
+    detect_parser.add_argument("--ransac-min-support", type=float, default=0.25, help="Fraction of the inliers of the first ring a circle needs to be kept as a ring by the ransac method")
+    detect_parser.add_argument("--inlier-threshold", type=float, default=1.0, help="Distance to a circle under which a point is an inlier of the ransac method")
+    detect_parser.add_argument("--time-budget", type=float, default=None, help="Seconds the ransac method may spend on a cloud, at least one batch of hypotheses is tried per ring")
+    detect_parser.add_argument("--racing", action="store_true", help="Successive halving of the attempts, the worst ones are dropped after short rounds of iterations")
+    detect_parser.add_argument("--racing-budget", type=int, default=5, help="Iterations of the first racing round")
+    detect_parser.add_argument("--racing-eta", type=float, default=2.0, help="Fraction 1/eta of the attempts kept after each round, the budget grows by eta")
+    detect_parser.add_argument("--k-range", default=None, help="With --unknown, range of numbers of circles to sweep, as min,max, instead of --num-circles")
+    detect_parser.add_argument("--validity", choices=["xie-beni", "partition-entropy"], default="xie-beni", help="Index used to choose the number of circles of a sweep")
+    detect_parser.add_argument("--prefilter-neighbors", type=int, default=None, help="Drop the points whose distance to their k-th neighbor is unusually large before the fit (k, e.g. 5)")
+    detect_parser.add_argument("--prefilter-factor", type=float, default=4.0, help="Robust deviations above the median k-th neighbor distance at which a point is dropped")
+    detect_parser.add_argument("--format", choices=["json", "jsonl", "npy"], default="json", help="Single JSON file, JSON lines streamed one cloud at a time, or a directory of memory-mappable .npy arrays with a JSON index (also streamed)")
+    detect_parser.add_argument("--resume", default=None, help="JSON lines file or store directory of an interrupted run, the clouds it holds are skipped (use the same --seed)")
+    detect_parser.add_argument("--cache", default=None, help="Cache directory, clouds already detected with the same settings and seed are read from it instead of fitted again")
+    detect_parser.add_argument("--cache-size", type=float, default=1024, help="Megabytes the cache may take, the least recently used entries are evicted at the end of the run")
+    detect_parser.add_argument("--metrics", default=None, help="File where the timers and counters of every cloud and their totals are saved, next to the results by default")
+    detect_parser.add_argument("--profile", choices=["cprofile", "tracemalloc"], default=None, help="Profile every cloud with cProfile or tracemalloc")
+    detect_parser.add_argument("--profile-dir", default=None, help="Directory of the profiles, one file per cloud, <output>/profiles by default")
+    detect_parser.set_defaults(run=run_detect)
+
+    analyze_parser = commands.add_parser("analyze", help="Print the accuracy stats of a results file")
+    analyze_parser.add_argument("results", help="Results file or store directory produced by detect")
+    analyze_parser.set_defaults(run=run_analyze)
+
+    cache_parser = commands.add_parser("cache", help="Print the hit and miss stats of a detection cache")
+    cache_parser.add_argument("cache", help="Cache directory used by detect --cache")
+    cache_parser.add_argument("--clear", action="store_true", help="Remove every entry and the stats")
+    cache_parser.set_defaults(run=run_cache)
+
+    args = parser.parse_args(argv)
+    args.run(args)
+
+if __name__ == "__main__":
+    main()
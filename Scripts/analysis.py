@@ -1,12 +1,5 @@
-import json, os
 import numpy as np
-from tkinter import *
-from matplotlib.figure import Figure
-from PyQt5.QtWidgets import *
-from matplotlib.backends.backend_tkagg import (
-    FigureCanvasTkAgg,
-    NavigationToolbar2Tk
-)
+from Scripts.results_io import is_results, load_results
 
 # Calculate stats
 
@@ -118,6 +111,13 @@ def extract_stats(results):
 # Visualize Stats
 
 def create_tables(stats):
+    # The plotting stack is only needed here, headless callers of extract_stats never load it
+    from tkinter import Tk
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_tkagg import (
+        FigureCanvasTkAgg,
+        NavigationToolbar2Tk
+    )
 
     visualize_window = Tk()
     visualize_window.resizable(False, False)
@@ -265,17 +265,17 @@ def create_tables(stats):
 # Main loop
 
 def show_accuracy(results_path, known_data):
+    from PyQt5.QtWidgets import QMessageBox
     if not bool(known_data):
         message = QMessageBox()
         message.setText(f"These results cannot be analyzed")
         message.exec_()
         return None
-    if not os.path.isfile(f"{results_path}"):
+    if not is_results(f"{results_path}"):
         message = QMessageBox()
         message.setText(f"The provided file does not exist:\n{results_path}")
         message.exec_()
         return None
-    f = open(f"{results_path}")
-    results = json.load(f)
+    results = load_results(f"{results_path}")
     stats = extract_stats(results)
     create_tables(stats)
\ No newline at end of file
@@ -0,0 +1,146 @@
+import argparse, json, os, platform, random, sys, tempfile, timeit, tracemalloc
+import numpy as np
+
+# Benchmark suite, run with python -m Scripts.benchmark
+# Every workload is one instance built by generator.get_data with a fixed seed, over a grid of ring points, rings
+# and noise ratios. Each stage of the pipeline is timed on it (best of REPEATS loops), and run once more under tracemalloc
+# for its peak memory. The report can be saved as a JSON baseline and later runs checked against it, a stage
+# regresses when it is slower (or takes more memory) than the baseline by more than the tolerance
+
+BENCH_SEED = 1234
+REPEATS = 3
+POINTS = [100, 1000] # Points per ring
+RINGS = [3, 5]
+NOISE_RATIOS = [0.05, 0.5]
+ATTEMPTS = 10 # Attempts of the end to end detect
+MEMORY_SLACK = 1.0 # Megabytes of peak memory growth never reported as a regression, tracemalloc is noisy for small stages
+
+def get_workload(points, rings, noise_ratio):
+    from Scripts.generator import GeneratorConfig, get_data
+    config = GeneratorConfig(num_circ=rings, range_points=(points, points), noise_ratio=noise_ratio, seed=BENCH_SEED)
+    return get_data("clean", config, np.random.default_rng(BENCH_SEED)), config
+
+def get_stages(points, rings, noise_ratio, directory):
+    # (name, function) of every stage, each function runs the stage once and returns the number of points it processed
+    import pandas as pd
+    from Scripts.utils import COLUMNS, extract_point_sets, read_point_sets, write_point_sets
+    from Scripts.generator import get_data
+    from Scripts.detection import DetectionConfig, alg_iteration, alg_perform, init_centers, score_run, run_detection
+    from Scripts.results_io import get_writer
+
+    data, generator_config = get_workload(points, rings, noise_ratio)
+    n = sum(len(points_set) for points_set in data)
+    frame = pd.DataFrame(np.concatenate([points_set.unpack() for points_set in data]), columns=COLUMNS)
+    dataset = f"{directory}/dataset"
+    for set_type in ["clean", "extends", "collides"]:
+        os.makedirs(f"{dataset}/{set_type}", exist_ok=True)
+    write_point_sets(f"{dataset}/clean/0.npy", data, True)
+    write_point_sets(f"{directory}/0.csv", data, True)
+
+    np_points, known_rings, _ = extract_point_sets(frame, True)
+    config = DetectionConfig(attempts=ATTEMPTS, seed=BENCH_SEED)
+    random.seed(BENCH_SEED)
+    centers = init_centers(rings, np_points)
+    fit = alg_perform(rings, np_points, config)
+
+    def generate():
+        get_data("clean", generator_config, np.random.default_rng(BENCH_SEED))
+        return n
+
+    def extract():
+        extract_point_sets(frame, True)
+        return n
+
+    def read_csv():
+        read_point_sets(f"{directory}/0.csv", True)
+        return n
+
+    def read_npy():
+        read_point_sets(f"{dataset}/clean/0.npy", True)
+        return n
+
+    def iteration():
+        alg_iteration(centers, np_points, 2.0)
+        return n
+
+    def perform():
+        random.seed(BENCH_SEED)
+        alg_perform(rings, np_points, config)
+        return n
+
+    def scoring():
+        score_run(fit[0], known_rings, np_points, fit[1], config.membership_threshold)
+        return n
+
+    def detect():
+        writer = get_writer(f"{directory}/results", "json")
+        try:
+            run_detection(dataset, config, writer)
+        finally:
+            writer.close()
+        return n
+
+    return [("generate", generate), ("extract_point_sets", extract), ("read_csv", read_csv), ("read_npy", read_npy),
+            ("alg_iteration", iteration), ("alg_perform", perform), ("scoring", scoring), ("detect", detect)]
+
+def measure(stage, repeats):
+    # Fast stages are called in a loop that lasts at least 0.2 seconds (as timeit does), so that their time is not noise
+    timer = timeit.Timer(stage)
+    number, _ = timer.autorange()
+    seconds = min(timer.repeat(repeats, number)) / number
+    processed = stage()
+    tracemalloc.start()
+    stage()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"seconds": seconds, "points": processed, "points_per_second": processed / seconds, "peak_mb": peak / 2**20}
+
+def run_benchmarks(grid, repeats=REPEATS):
+    report = {"python": platform.python_version(), "numpy": np.__version__, "machine": platform.machine(), "seed": BENCH_SEED, "cases": {}}
+    for points, rings, noise_ratio in grid:
+        workload = f"p{points}_r{rings}_n{noise_ratio}"
+        with tempfile.TemporaryDirectory() as directory:
+            for name, stage in get_stages(points, rings, noise_ratio, directory):
+                case = report["cases"][f"{workload}/{name}"] = measure(stage, repeats)
+                print(f"{workload + '/' + name:<32} {case['seconds']*1000:10.2f} ms {case['points_per_second']:14,.0f} points/s {case['peak_mb']:9.2f} MB")
+    return report
+
+def check_regressions(report, baseline, tolerance):
+    # Names of the cases slower or heavier than the baseline by more than the tolerance, cases missing from either are skipped
+    regressions = []
+    for name, case in report["cases"].items():
+        reference = baseline["cases"].get(name)
+        if reference is None:
+            continue
+        slower = case["seconds"] > reference["seconds"] * (1 + tolerance)
+        heavier = case["peak_mb"] > reference["peak_mb"] * (1 + tolerance) + MEMORY_SLACK
+        if slower or heavier:
+            regressions.append(name)
+            print(f"{name:<32} REGRESSED: {case['seconds']*1000:.2f} ms vs {reference['seconds']*1000:.2f} ms, "
+                  f"{case['peak_mb']:.2f} MB vs {reference['peak_mb']:.2f} MB")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m Scripts.benchmark", description="Time every stage of the detection pipeline on fixed-seed workloads")
+    parser.add_argument("--output", default=None, help="File in which the report is saved as a JSON baseline")
+    parser.add_argument("--baseline", default=None, help="Baseline to check the run against, exits with an error when a stage regressed")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="Fraction by which a stage may be slower or heavier than its baseline")
+    parser.add_argument("--repeats", type=int, default=REPEATS, help="Runs of every stage, the fastest one is reported")
+    parser.add_argument("--quick", action="store_true", help="Only the smallest workload")
+    args = parser.parse_args(argv)
+
+    grid = [(p, r, n) for p in POINTS for r in RINGS for n in NOISE_RATIOS]
+    report = run_benchmarks(grid[:1] if args.quick else grid, args.repeats)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4)
+        print(f"Report saved in {args.output}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = check_regressions(report, json.load(f), args.tolerance)
+        print(f"{len(regressions)} of {len(report['cases'])} cases regressed against {args.baseline}")
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
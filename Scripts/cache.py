@@ -0,0 +1,133 @@
+import os, json, shutil, hashlib, uuid
+import numpy as np
+from Scripts.results_io import to_serializable, pack_arrays, unpack_arrays
+
+# Content-addressed cache of detection entries
+#   <cache_dir>/<key>/entry.json     the entry with every array replaced by {"$npy": "entry.<field>.npy"}
+#   <cache_dir>/<key>/*.npy          the arrays of the entry
+#   <cache_dir>/stats.json           hits, misses and evictions of every run so far
+# The key hashes the points of the cloud, its rings when they are known, the seed of the file and every setting
+# that changes the result, so a cloud is only detected again when one of them changes
+# Reading an entry touches it, when the cache grows over its size the least recently used entries are evicted
+# run_detection evicts every time EVICTION_SLACK of the size has been written and once more at the end of the run,
+# so during a run the cache may hold up to that much more than its size
+
+# Bumped whenever the detection code changes its results, so that older entries are not reused
+CACHE_VERSION = 1
+# Settings that do not change the entry. The global seed is replaced by the seed of each file
+IGNORED_SETTINGS = ["workers", "dtype", "seed", "cache_dir", "cache_size", "profile", "profile_dir"]
+EVICTION_SLACK = 0.1
+
+def get_cache_key(points, rings, seed, config):
+    digest = hashlib.sha256()
+    digest.update(np.ascontiguousarray(points, dtype=np.float64).tobytes())
+    settings = {name: value for name, value in vars(config).items() if name not in IGNORED_SETTINGS}
+    rings = [[r.circ_no, r.center, r.radius, len(r)] for r in rings] if rings is not None else None
+    digest.update(json.dumps([CACHE_VERSION, seed, rings, settings], sort_keys=True, default=to_serializable).encode())
+    return digest.hexdigest()
+
+def materialize(value):
+    # Plain dicts, lists and in-memory arrays, the cached files may be evicted while the entry is still in use
+    if isinstance(value, np.ndarray):
+        return np.array(value)
+    if isinstance(value, dict) or hasattr(value, "keys"):
+        return {key: materialize(value[key]) for key in value.keys()}
+    if isinstance(value, list):
+        return [materialize(item) for item in value]
+    return value
+
+def get_size(path):
+    # Files removed while walking (an entry evicted by another process) are not counted
+    size = 0
+    for root, _, names in os.walk(path):
+        for name in names:
+            try:
+                size += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return size
+
+class DetectionCache:
+    def __init__(self, path, max_size):
+        self.path = path
+        self.max_size = max_size
+        os.makedirs(path, exist_ok=True)
+
+    def get(self, key):
+        index = f"{self.path}/{key}/entry.json"
+        try:
+            with open(index) as f:
+                skeleton = json.load(f)
+            entry = materialize(unpack_arrays(skeleton, f"{self.path}/{key}"))
+        except (OSError, ValueError):
+            # Missing or evicted while reading
+            return None
+        try:
+            os.utime(index)
+        except OSError:
+            # Evicted after the read, the entry is already in memory
+            pass
+        return entry
+
+    def put(self, key, entry):
+        # Written in a temporary directory and renamed, so a concurrent reader never sees half an entry
+        # Returns the bytes added to the cache
+        temporary = f"{self.path}/.{key}.{uuid.uuid4().hex}"
+        os.makedirs(temporary)
+        skeleton = pack_arrays(entry, temporary, "entry")
+        with open(f"{temporary}/entry.json", 'w') as f:
+            json.dump(skeleton, f, default=to_serializable)
+        size = get_size(temporary)
+        try:
+            os.rename(temporary, f"{self.path}/{key}")
+        except OSError:
+            # Another worker stored the same entry first
+            shutil.rmtree(temporary, ignore_errors=True)
+            return 0
+        return size
+
+    def entries(self):
+        # (key, size in bytes, last use) of every entry. Dot-prefixed names are entries still being written by put,
+        # and entries removed while listing are skipped
+        entries = []
+        for key in os.listdir(self.path):
+            if key.startswith("."):
+                continue
+            try:
+                last_use = os.path.getmtime(f"{self.path}/{key}/entry.json")
+            except OSError:
+                continue
+            entries.append((key, get_size(f"{self.path}/{key}"), last_use))
+        return entries
+
+    def evict(self):
+        # Removes the least recently used entries until the cache fits in max_size, returns how many were removed
+        entries = sorted(self.entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        for key, size, _ in entries:
+            if total <= self.max_size:
+                break
+            shutil.rmtree(f"{self.path}/{key}", ignore_errors=True)
+            total -= size
+            evicted += 1
+        return evicted
+
+    def stats(self):
+        try:
+            with open(f"{self.path}/stats.json") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"hits": 0, "misses": 0, "evictions": 0}
+
+    def record(self, hits, misses, evictions=0):
+        stats = self.stats()
+        stats["hits"] += hits
+        stats["misses"] += misses
+        stats["evictions"] += evictions
+        with open(f"{self.path}/stats.json", 'w') as f:
+            json.dump(stats, f)
+
+    def clear(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.makedirs(self.path, exist_ok=True)
@@ -1,126 +1,810 @@
-import math, random, os, datetime, json, timeit
+import random, os, timeit, zlib, functools
 import numpy as np
-import pandas as pd
-from scipy.optimize import linear_sum_assignment
-from tqdm import tqdm
-from Scripts.utils import PointsSet
-from PyQt5.QtWidgets import *
-
-def extract_point_sets(df):
-    data = []
-    if DATA_KNOWN:
-        for _, row in df.iterrows():
-            existing_ps = next(filter(lambda ps: ps.circ_no==row.circ_no if not math.isnan(row.circ_no) else ps.circ_no is None, data), None)
-            if existing_ps is not None:
-                existing_ps.add_point((row.point_x, row.point_y))
-            else:
-                data.append(PointsSet.parse([(row.point_x, row.point_y)], (row.center_x, row.center_y), row.radius, row.circ_no))
-        
-        noise = [ps.points for ps in list(filter(lambda x : x.is_noise() , data))]
-        rings = sorted(list(filter(lambda x : not x.is_noise() , data)), key=lambda x: x.circ_no)
-    else:
-        for _, row in df.iterrows():
-            data.append(PointsSet.parse([(row.point_x, row.point_y)], math.nan, math.nan, math.nan))
-        rings = None
-        noise = None
-
-    points = []
-    for points_set in data:
-        points.extend(points_set.points)
-
-    return (points, rings, noise)
+from Scripts.utils import DATASET_EXTENSIONS, read_point_sets
+from Scripts.results_io import get_writer
+from Scripts import metrics
 
 ## ALGORITHM
 
-def alg_iteration(centers, points, m):
-    # m is the fuzziness parameter, usually set to 2
+def get_memberships(distances, m):
+    # Normalized inverse distance powers, u_ij = d_ij^(-p) / sum_k d_ik^(-p) with p = 2/(m-1)
+    # Dividing by the closest distance first keeps every ratio in [0, 1], so there is no overflow for m close to 1
     fuzziness = 2 / (m - 1)
-    n_clusters = len(centers)
+    closest = distances.min(axis=-1, keepdims=True)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        weights = (closest / distances) ** fuzziness
+    on_center = closest == 0
+    if on_center.any():
+        # A point sitting on a center fully belongs to it (shared if several centers coincide)
+        weights = np.where(on_center, distances == 0, weights).astype(distances.dtype)
+    return weights / weights.sum(axis=-1, keepdims=True)
+
+@metrics.instrument("alg_iteration")
+def alg_iteration_batched(centers, points, m, chunk_size=None):
+    # Advances several independent runs at once, centers is (attempts, k, 2) and m holds one fuzziness per attempt
+    n_attempts, n_clusters, _ = centers.shape
     n_points = len(points)
-    membership_matrix = np.zeros((n_points, n_clusters))
+    chunk_size = max(chunk_size or n_points, 1)
+    m = np.asarray(m, dtype=points.dtype).reshape(n_attempts, 1, 1)
+    membership_matrices = np.empty((n_attempts, n_points, n_clusters), dtype=points.dtype)
 
-    np_centers = np.array(centers)
-    np_points = np.array(points)
-    
     # Legacy Loop
     #for i in range(n_points):
     #    for j in range(n_clusters):
     #        distance = np.sqrt((centers[j][0]-points[i][0])**2 + (centers[j][1]-points[i][1])**2)
     #        membership_matrix[i][j] = 1 / ((sum([(distance/np.sqrt((centers[k][0]-points[i][0])**2 + (centers[k][1]-points[i][1])**2))**(fuzziness) for k in range(n_clusters)])))
 
-    # Optimized calcuation
-    distances = np.sqrt(np.sum((np_centers[:, np.newaxis, :] - np_points)**2, axis=2))
-    distances = distances.T
-    membership_matrix = 1 / ((distances[:, :, np.newaxis]/distances[:, np.newaxis, :]) ** (fuzziness)).sum(axis=2)
-
-    # update the cluster centroids based on the membership degrees
-    new_centers = [(0,0) for _ in range(n_clusters)]
-    for j in range(n_clusters):
-        new_centers[j] = tuple(np.average(points, axis=0, weights=membership_matrix[:, j]**m))
-    return new_centers, membership_matrix
-
-def alg_perform(k, points):
-    old_centers = [(random.uniform(0.0, 100.0), random.uniform(0.0, 100.0)) for _ in range(k)]
-    fuzziness = random.uniform(*FUZZINESS_RANGE)
-    new_centers, membership_matrix = alg_iteration(old_centers, points, fuzziness)
+    # Optimized calculation, memory stays O(n*k) per attempt and the points can be streamed in chunks
+    weighted_sums = np.zeros((n_attempts, n_clusters, 2), dtype=points.dtype)
+    total_weights = np.zeros((n_attempts, n_clusters), dtype=points.dtype)
+    objectives = np.zeros(n_attempts, dtype=points.dtype)
+    for start in range(0, n_points, chunk_size):
+        chunk = points[start:start+chunk_size]
+        distances = np.sqrt(np.sum((chunk[np.newaxis, :, np.newaxis, :] - centers[:, np.newaxis, :, :])**2, axis=3))
+        memberships = get_memberships(distances, m)
+        membership_matrices[:, start:start+chunk_size] = memberships
+
+        weights = memberships**m
+        weighted_sums += weights.transpose(0, 2, 1) @ chunk
+        total_weights += weights.sum(axis=1)
+        objectives += np.sum(weights * distances**2, axis=(1, 2))
+
+    # update the cluster centroids based on the membership degrees, a cluster without weight keeps its center
+    has_weight = total_weights[:, :, np.newaxis] > 0
+    new_centers = np.where(has_weight, weighted_sums / np.where(has_weight, total_weights[:, :, np.newaxis], 1), centers)
+    return new_centers, membership_matrices, objectives
+
+def alg_iteration(centers, points, m, dtype=np.float64, chunk_size=None):
+    # m is the fuzziness parameter, usually set to 2
+    np_centers = np.asarray(centers, dtype=dtype)[np.newaxis]
+    new_centers, membership_matrices, _ = alg_iteration_batched(np_centers, np.asarray(points, dtype=dtype), [m], chunk_size)
+    return [tuple(c) for c in new_centers[0].astype(np.float64)], membership_matrices[0]
+
+@metrics.instrument("shell_iteration")
+def shell_iteration_batched(prototypes, points, m, chunk_size=None, noise_distance=None):
+    # Fuzzy c-rings step, prototypes is (attempts, k, 3) with the center and radius of each ring
+    # The distance of a point to a ring is |‖x-c‖-r|, so the prototypes fit the rings themselves instead of blob centroids
+    # With a noise distance an extra noise prototype at that constant distance takes the points far from every ring
+    n_attempts, n_clusters, _ = prototypes.shape
+    n_points = len(points)
+    chunk_size = max(chunk_size or n_points, 1)
+    m = np.asarray(m, dtype=points.dtype).reshape(n_attempts, 1, 1)
+    centers, radii = prototypes[:, :, :2], prototypes[:, :, 2]
+    membership_matrices = np.empty((n_attempts, n_points, n_clusters), dtype=points.dtype)
+
+    weighted_sums = np.zeros((n_attempts, n_clusters, 2), dtype=points.dtype)
+    weighted_directions = np.zeros((n_attempts, n_clusters, 2), dtype=points.dtype)
+    weighted_radii = np.zeros((n_attempts, n_clusters), dtype=points.dtype)
+    total_weights = np.zeros((n_attempts, n_clusters), dtype=points.dtype)
+    objectives = np.zeros(n_attempts, dtype=points.dtype)
+    for start in range(0, n_points, chunk_size):
+        chunk = points[start:start+chunk_size]
+        offsets = chunk[np.newaxis, :, np.newaxis, :] - centers[:, np.newaxis, :, :]
+        center_distances = np.sqrt(np.sum(offsets**2, axis=3))
+        distances = np.abs(center_distances - radii[:, np.newaxis, :])
+        if noise_distance is None:
+            memberships = get_memberships(distances, m)
+        else:
+            noise = np.broadcast_to(np.asarray(noise_distance, dtype=points.dtype).reshape(-1, 1, 1), distances.shape[:2] + (1,))
+            memberships = get_memberships(np.concatenate((distances, noise), axis=2), m)[:, :, :-1]
+        membership_matrices[:, start:start+chunk_size] = memberships
+
+        weights = memberships**m
+        # Unit vectors from each center to each point, a point on a center has no direction
+        with np.errstate(divide="ignore", invalid="ignore"):
+            directions = np.where(center_distances[..., np.newaxis] > 0, offsets / center_distances[..., np.newaxis], 0)
+        weighted_sums += weights.transpose(0, 2, 1) @ chunk
+        weighted_directions += np.einsum("anc,ancd->acd", weights, directions)
+        weighted_radii += np.sum(weights * center_distances, axis=1)
+        total_weights += weights.sum(axis=1)
+        objectives += np.sum(weights * distances**2, axis=(1, 2))
+
+    # r = Σw‖x-c‖/Σw and c = Σw(x - r(x-c)/‖x-c‖)/Σw, a ring without weight keeps its prototype
+    has_weight = total_weights > 0
+    safe_weights = np.where(has_weight, total_weights, 1)[:, :, np.newaxis]
+    new_radii = weighted_radii / safe_weights[:, :, 0]
+    new_centers = (weighted_sums - new_radii[:, :, np.newaxis] * weighted_directions) / safe_weights
+    new_prototypes = np.where(has_weight[:, :, np.newaxis], np.concatenate((new_centers, new_radii[:, :, np.newaxis]), axis=2), prototypes)
+    return new_prototypes, membership_matrices, objectives
+
+def get_initial_radii(centers, points, membership_matrices, m, chunk_size=None):
+    # Mean distance from each center to the points, weighted by their memberships raised to the fuzziness
+    chunk_size = max(chunk_size or len(points), 1)
+    m = np.asarray(m, dtype=points.dtype).reshape(-1, 1, 1)
+    weighted_distances = np.zeros(centers.shape[:2], dtype=points.dtype)
+    total_weights = np.zeros(centers.shape[:2], dtype=points.dtype)
+    for start in range(0, len(points), chunk_size):
+        chunk = points[start:start+chunk_size]
+        distances = np.sqrt(np.sum((chunk[np.newaxis, :, np.newaxis, :] - centers[:, np.newaxis, :, :])**2, axis=3))
+        weights = membership_matrices[:, start:start+chunk_size]**m
+        weighted_distances += np.sum(weights * distances, axis=1)
+        total_weights += weights.sum(axis=1)
+    return weighted_distances / np.maximum(total_weights, np.finfo(points.dtype).tiny)
+
+def get_center_shifts(old_centers, new_centers):
+    # Largest center displacement of each attempt
+    return np.sqrt(np.sum((new_centers - old_centers)**2, axis=-1)).max(axis=-1)
+
+def get_common_objectives(prototypes, points, m, chunk_size=None):
+    # Fuzzy objective of every attempt recomputed at the same m. The objective of each attempt shrinks as its own m grows,
+    # so attempts with different fuzziness are only comparable at a common m. Prototypes with a third column are rings
+    chunk_size = max(chunk_size or len(points), 1)
+    objectives = np.zeros(len(prototypes))
+    for start in range(0, len(points), chunk_size):
+        chunk = points[start:start+chunk_size]
+        distances = np.sqrt(np.sum((chunk[np.newaxis, :, np.newaxis, :] - prototypes[:, np.newaxis, :, :2])**2, axis=3))
+        if prototypes.shape[2] > 2:
+            distances = np.abs(distances - prototypes[:, np.newaxis, :, 2])
+        objectives += np.sum(get_memberships(distances, m)**m * distances**2, axis=(1, 2))
+    return objectives
+
+SEEDING_STRATEGIES = ["uniform", "kmeans++", "density"]
+
+def init_centers(k, points, strategy="uniform"):
+    match strategy:
+        case "uniform":
+            return [(random.uniform(0.0, 100.0), random.uniform(0.0, 100.0)) for _ in range(k)]
+        case "kmeans++":
+            # Each new center is a point drawn with probability proportional to its squared distance to the closest chosen center
+            points = np.asarray(points, dtype=np.float64)
+            centers = [points[random.randrange(len(points))]]
+            closest = np.sum((points - centers[0])**2, axis=1)
+            for _ in range(1, k):
+                cumulative = np.cumsum(closest)
+                index = int(np.searchsorted(cumulative, random.random() * cumulative[-1], side="right")) if cumulative[-1] > 0 else random.randrange(len(points))
+                centers.append(points[min(index, len(points)-1)])
+                closest = np.minimum(closest, np.sum((points - centers[-1])**2, axis=1))
+            return [tuple(c) for c in centers]
+        case "density":
+            # Density peaks over a grid of the plane, cells are ranked by density times the distance to the closest denser cell
+            bins = 20
+            cell_size = 100.0 / bins
+            counts, _, _ = np.histogram2d(*np.asarray(points, dtype=np.float64).T, bins=bins, range=[[0.0, 100.0], [0.0, 100.0]])
+            cells = np.argwhere(counts > 0)
+            density = counts[counts > 0]
+            cell_centers = (cells + 0.5) * cell_size
+            cell_distances = np.sqrt(np.sum((cell_centers[:, np.newaxis, :] - cell_centers)**2, axis=2))
+            rank = np.empty(len(cells), dtype=int)
+            rank[np.argsort(-density, kind="stable")] = np.arange(len(cells))
+            separation = np.where(rank[np.newaxis, :] < rank[:, np.newaxis], cell_distances, np.inf).min(axis=1)
+            separation[rank == 0] = cell_distances.max(initial=0.0)
+            peaks = cell_centers[np.argsort(-density * separation, kind="stable")[:k]]
+            # Jitter inside the cell so that every attempt starts from a different point
+            centers = [(x + random.uniform(-cell_size/2, cell_size/2), y + random.uniform(-cell_size/2, cell_size/2)) for x, y in peaks]
+            return centers + init_centers(k - len(centers), points, "uniform")
+        case _:
+            raise ValueError(f"Unknown seeding strategy {strategy}")
+
+def alg_perform(k, points, config):
+    return alg_perform_batched(k, points, 1, config)[0]
+
+def iterate_batched(iteration, prototypes, points, fuzziness, config, max_iterations=None):
+    # Iterates every attempt until its prototypes move less than the tolerance (or its objective changes less than
+    # objective_tolerance) or max_iterations is reached. converged tells the attempts that stopped before max_iterations
+    max_iterations = config.max_iterations if max_iterations is None else max_iterations
+    new_prototypes, membership_matrices, objectives = iteration(prototypes, points, fuzziness, config.chunk_size)
+    shifts = get_center_shifts(prototypes, new_prototypes)
+    iterations = np.ones(len(prototypes), dtype=int)
+
+    # Attempts whose centers moved less than the tolerance are masked out of the following iterations
+    active = np.flatnonzero(shifts > config.tolerance)
     count = 1
-    while(count<=MAX_ITERATIONS and old_centers!=new_centers):
-        old_centers = new_centers
-        new_centers, membership_matrix = alg_iteration(old_centers, points, fuzziness)
+    while(count<=max_iterations and len(active)>0):
+        old_prototypes, old_objectives = new_prototypes[active], objectives[active]
+        new_prototypes[active], membership_matrices[active], objectives[active] = iteration(old_prototypes, points, fuzziness[active], config.chunk_size)
+        shifts[active] = get_center_shifts(old_prototypes, new_prototypes[active])
+        iterations[active] += 1
+
+        moving = shifts[active] > config.tolerance
+        if config.objective_tolerance is not None:
+            moving &= np.abs(objectives[active] - old_objectives) > config.objective_tolerance * old_objectives
+        active = active[moving]
         count +=1
-    return new_centers, membership_matrix
 
-def estimate_radii(center, points, center_membership_matrix):
-    member_weights = center_membership_matrix[center_membership_matrix >= MEMBERSHIP_THRESSHOLD]
-    member_points = np.asarray(points)[center_membership_matrix >= MEMBERSHIP_THRESSHOLD]
-    return np.average([np.sqrt((center[0]-p[0])**2 + (center[1]-p[1])**2) for p in member_points], weights=member_weights)
+    converged = np.ones(len(prototypes), dtype=bool)
+    converged[active] = False
+    return new_prototypes, membership_matrices, iterations, shifts, objectives, converged
 
-## ERROR
+def race_batched(prototypes, points, fuzziness, config, rank):
+    # Successive halving: every round runs the surviving attempts for a budget of iterations, ranks them with rank
+    # (lower is better) and keeps the best 1/racing_eta of them, the budget grows racing_eta times every round
+    # The last survivors run up to max_iterations like any attempt. Attempts that have converged are not iterated again
+    prototypes = prototypes.copy()
+    membership_matrices = np.empty((len(prototypes), len(points), prototypes.shape[1]), dtype=points.dtype)
+    iterations = np.zeros(len(prototypes), dtype=int)
+    shifts = np.full(len(prototypes), np.inf)
+    objectives = np.zeros(len(prototypes), dtype=points.dtype)
+    converged = np.zeros(len(prototypes), dtype=bool)
+
+    survivors = np.arange(len(prototypes))
+    schedule = []
+    budget, spent = config.racing_budget, 0
+    while True:
+        last = len(survivors) <= 1 or spent + budget >= config.max_iterations + 1
+        round_budget = config.max_iterations + 1 - spent if last else budget
+        moving = survivors[~converged[survivors]]
+        if len(moving) > 0:
+            prototypes[moving], membership_matrices[moving], round_iterations, shifts[moving], objectives[moving], converged[moving] = iterate_batched(
+                alg_iteration_batched, prototypes[moving], points, fuzziness[moving], config, round_budget - 1)
+            iterations[moving] += round_iterations
+        spent += round_budget
+        if last:
+            schedule.append({"iterations": spent, "attempts": int(len(survivors)), "pruned": 0})
+            break
+        scores = rank(prototypes[survivors], membership_matrices[survivors], objectives[survivors])
+        keep = max(1, int(np.ceil(len(survivors) / config.racing_eta)))
+        schedule.append({"iterations": spent, "attempts": int(len(survivors)), "pruned": int(len(survivors) - keep)})
+        survivors = survivors[np.sort(np.argsort(scores, kind="stable")[:keep])]
+        budget = int(np.ceil(budget * config.racing_eta))
+
+    return survivors, prototypes[survivors], membership_matrices[survivors], iterations[survivors], shifts[survivors], objectives[survivors], schedule
+
+# A mini-batch attempt stops after MINIBATCH_PATIENCE iterations without lowering its smoothed batch objective by a
+# relative MINIBATCH_IMPROVEMENT, the objective is smoothed over roughly the last MINIBATCH_WINDOW batches
+MINIBATCH_PATIENCE = 10
+MINIBATCH_IMPROVEMENT = 1e-3
+MINIBATCH_WINDOW = 10
+
+def iterate_minibatch(centers, points, fuzziness, config, rank):
+    # Mini-batch fuzzy c-means, each iteration moves the centers towards the weighted centroids of a random batch of points
+    # The step of a center is its weight in the batch over all the weight it has received, so it decays like 1/t
+    # Only the batch memberships are computed while iterating, the full matrix is computed in chunks at the end
+    # The batch noise keeps the centers moving, so an attempt also stops once a smoothed batch objective stops improving
+    # Only the best attempt (lowest rank) is returned, with the same values as race_batched
+    rng = np.random.default_rng(random.getrandbits(32))
+    batch_size = min(config.batch_size, len(points))
+    centers = centers.copy()
+    received_weights = np.zeros(centers.shape[:2], dtype=points.dtype)
+    shifts = np.full(len(centers), np.inf)
+    iterations = np.zeros(len(centers), dtype=int)
+    smoothing = 2 / (MINIBATCH_WINDOW + 1) if batch_size < len(points) else 1.0
+    smoothed_objectives = np.full(len(centers), np.nan)
+    best_objectives = np.full(len(centers), np.inf)
+    stalled = np.zeros(len(centers), dtype=int)
+
+    active = np.arange(len(centers))
+    count = 0
+    while(count<=config.max_iterations and len(active)>0):
+        batch = points[np.sort(rng.choice(len(points), batch_size, replace=False))]
+        old_centers = centers[active]
+        batch_centers, memberships, objectives = alg_iteration_batched(old_centers, batch, fuzziness[active])
+        batch_weights = np.sum(memberships**fuzziness[active].reshape(-1, 1, 1), axis=1)
+        received_weights[active] += batch_weights
+        steps = batch_weights / np.maximum(received_weights[active], np.finfo(points.dtype).tiny)
+        centers[active] = old_centers + steps[:, :, np.newaxis] * (batch_centers - old_centers)
+        shifts[active] = get_center_shifts(old_centers, centers[active])
+        iterations[active] += 1
 
-def find_pairs(centers, rings_centers):
-    cost_matrix = np.zeros((len(centers), len(rings_centers)))
-    
+        objectives = objectives / batch_size
+        smoothed_objectives[active] = np.where(np.isnan(smoothed_objectives[active]), objectives, (1 - smoothing) * smoothed_objectives[active] + smoothing * objectives)
+        improved = smoothed_objectives[active] < best_objectives[active] * (1 - MINIBATCH_IMPROVEMENT)
+        best_objectives[active] = np.where(improved, smoothed_objectives[active], best_objectives[active])
+        stalled[active] = np.where(improved, 0, stalled[active] + 1)
+        active = active[(shifts[active] > config.tolerance) & (stalled[active] < MINIBATCH_PATIENCE)]
+        count +=1
+
+    # The full memberships are computed one attempt at a time and only the best ones are kept, so the memory stays
+    # that of a single (n, k) matrix whatever the number of attempts
+    best, best_score = None, np.inf
     for i in range(len(centers)):
-        for j in range(len(rings_centers)):
-            cost_matrix[i][j] = np.sqrt((centers[i][0] - rings_centers[j][0])**2 + (centers[i][1] - rings_centers[j][1])**2)
-    center_ind, ring_ind = linear_sum_assignment(cost_matrix)
+        _, membership_matrix, objective = alg_iteration_batched(centers[i:i+1], points, fuzziness[i:i+1], config.chunk_size or batch_size)
+        score = rank(centers[i:i+1], membership_matrix, objective)[0] if len(centers) > 1 else 0.0
+        if best is None or score < best_score:
+            best, best_score, best_membership, best_objective = i, score, membership_matrix, objective
+    survivors = np.array([best])
+    return survivors, centers[survivors], best_membership, iterations[survivors], shifts[survivors], best_objective
+
+def alg_perform_batched(k, points, attempts, config, rings=None):
+    # Runs `attempts` independent alg_perform calls as one stacked computation, drawing the same random values in the same order
+    # With racing or minibatch, only the attempts that survive are returned. They are ranked by their error against rings when
+    # the rings are known, otherwise by their fuzzy objective recomputed at the middle of the fuzziness range
+    initial_states = [(init_centers(k, points, config.seeding), random.uniform(*config.fuzziness_range)) for _ in range(attempts)]
+    np_points = np.asarray(points, dtype=config.dtype)
+    initial_centers = np.array([centers for centers, _ in initial_states], dtype=config.dtype).reshape(attempts, k, 2)
+    fuzziness = np.array([m for _, m in initial_states], dtype=config.dtype)
+    return fit_batched(initial_centers, np_points, fuzziness, config, rings)
+
+def fit_batched(initial_centers, np_points, fuzziness, config, rings=None):
+    schedule = None
+    def rank(centers, membership_matrices, objectives):
+        if rings is None:
+            return get_common_objectives(centers, np_points, np.mean(config.fuzziness_range), config.chunk_size)
+        errors = np.array([score_run([tuple(c) for c in attempt_centers], rings, np_points, membership_matrix, config.membership_threshold)["tot_error"]
+                           for attempt_centers, membership_matrix in zip(centers.astype(np.float64), membership_matrices)])
+        return np.where(np.isnan(errors), np.inf, errors)
+
+    if config.method == "minibatch":
+        survivors, centers, membership_matrices, iterations, shifts, objectives = iterate_minibatch(initial_centers, np_points, fuzziness, config, rank)
+        fuzziness = fuzziness[survivors]
+    elif config.racing and len(initial_centers) > 1:
+        survivors, centers, membership_matrices, iterations, shifts, objectives, schedule = race_batched(initial_centers, np_points, fuzziness, config, rank)
+        fuzziness = fuzziness[survivors]
+    else:
+        centers, membership_matrices, iterations, shifts, objectives, _ = iterate_batched(alg_iteration_batched, initial_centers, np_points, fuzziness, config)
+    if config.method == "shells":
+        # Rings are refined from the fuzzy c-means solution, starting shells from random centers mostly ends in rings spanning several clusters
+        shells = np.concatenate((centers, get_initial_radii(centers, np_points, membership_matrices, fuzziness, config.chunk_size)[:, :, np.newaxis]), axis=2)
+        iteration = functools.partial(shell_iteration_batched, noise_distance=config.noise_distance)
+        centers, membership_matrices, shell_iterations, shifts, objectives, _ = iterate_batched(iteration, shells, np_points, fuzziness, config)
+        iterations += shell_iterations
+
+    runs = [([tuple(c) for c in prototypes[:, :2]], membership_matrix, {"iterations": int(n_iter), "center_shift": float(shift), "objective": float(objective)})
+            for prototypes, membership_matrix, n_iter, shift, objective in zip(centers.astype(np.float64), membership_matrices, iterations, shifts, objectives)]
+    if schedule is not None:
+        for _, _, info in runs:
+            info["racing"] = schedule
+    if config.method == "shells":
+        for (_, _, info), prototypes in zip(runs, centers.astype(np.float64)):
+            info["radii"] = [float(r) for r in prototypes[:, 2]]
+    return runs
+
+def get_ring_distances(centers, points, radii=None):
+    # Distance of every point to every prototype, |‖x-c‖-r| when the prototypes are rings
+    distances = np.sqrt(np.sum((np.asarray(points)[:, np.newaxis, :] - np.asarray(centers)[np.newaxis, :, :])**2, axis=2))
+    return distances if radii is None else np.abs(distances - np.asarray(radii))
 
-    return [[int(center_ind[i]), int(ring_ind[i])] for i in range(len(center_ind))]
+def get_validity(index, centers, points, membership_matrix, m, radii=None):
+    # Cluster validity of a solution, lower is better for both indices
+    match index:
+        case "xie-beni":
+            # Compactness over the closest pair of prototypes (centers and radii for rings)
+            distances = get_ring_distances(centers, points, radii)
+            prototypes = np.column_stack((centers, radii)) if radii is not None else np.asarray(centers)
+            separations = np.sum((prototypes[:, np.newaxis, :] - prototypes[np.newaxis, :, :])**2, axis=2)
+            separation = separations[np.triu_indices(len(prototypes), k=1)].min()
+            return float(np.sum(membership_matrix**m * distances**2) / (len(points) * separation)) if separation > 0 else float("inf")
+        case "partition-entropy":
+            memberships = membership_matrix[membership_matrix > 0]
+            return float(-np.sum(memberships * np.log(memberships)) / len(points))
+        case _:
+            raise ValueError(f"Unknown validity index {index}")
 
-def get_centers_error(pairs, centers, rings):
-    avg_offset = np.mean([np.sqrt((centers[p[0]][0] - rings[p[1]].center[0])**2 + (centers[p[0]][1] - rings[p[1]].center[1])**2) for p in pairs])
-    return avg_offset / np.sqrt(2000)
+def choose_rings(centers, radii, points, k, config, info):
+    # Solution of the engines that find the rings one by one (hough, ransac), strongest first. The memberships come
+    # from the ring distances with the middle of the fuzziness range. When k is None, every k of config.k_range
+    # is scored with the validity index and the best one is kept
+    # When no ring was found (no peak, no circle in the radius range, or too few points) the solution is empty
+    m = sum(config.fuzziness_range) / 2
+    def solution(count):
+        chosen_centers = [(float(x), float(y)) for x, y in centers[:count]]
+        chosen_radii = [float(radius) for radius in radii[:count]]
+        if not chosen_centers:
+            return chosen_centers, np.empty((len(points), 0)), chosen_radii
+        return chosen_centers, get_memberships(get_ring_distances(chosen_centers, points, chosen_radii), m), chosen_radii
 
-def get_radii_error(pairs, centers, rings, points, membership_matrix):
-    return np.mean([abs(estimate_radii(centers[p[0]], points, membership_matrix[:, p[0]]) - rings[p[1]].radius)/rings[p[1]].radius for p in pairs])
+    if k is not None:
+        chosen_centers, membership_matrix, info["radii"] = solution(len(centers))
+        return chosen_centers, membership_matrix, info
+
+    scores = {}
+    for count in range(config.k_range[0], min(config.k_range[1], len(centers)) + 1):
+        chosen_centers, membership_matrix, chosen_radii = solution(count)
+        scores[count] = get_validity(config.validity, chosen_centers, points, membership_matrix, m, chosen_radii)
+    chosen_centers, membership_matrix, info["radii"] = solution(min(scores, key=scores.get) if scores else len(centers))
+    info["sweep_iterations"] = info["iterations"]
+    info["k_scores"] = {str(count): score for count, score in scores.items()}
+    return chosen_centers, membership_matrix, info
+
+def add_center(centers, points, radii=None):
+    # New center of a warm start, a point drawn with probability proportional to its squared distance to the closest prototype
+    closest = get_ring_distances(centers, points, radii).min(axis=1)**2
+    cumulative = np.cumsum(closest)
+    index = int(np.searchsorted(cumulative, random.random() * cumulative[-1], side="right")) if cumulative[-1] > 0 else random.randrange(len(points))
+    return list(centers) + [tuple(points[min(index, len(points)-1)])]
+
+def alg_sweep(points, config):
+    # Fits every k of config.k_range with a single attempt and keeps the one with the best validity index
+    # Each k is warm started from the solution of k-1 plus one new center, so most of them converge in a few iterations
+    np_points = np.asarray(points, dtype=config.dtype)
+    m = random.uniform(*config.fuzziness_range)
+    k_min, k_max = config.k_range
+    runs, scores = {}, {}
+    centers = init_centers(k_min, points, config.seeding)
+    for k in range(k_min, k_max+1):
+        if k > k_min:
+            previous_centers, previous_membership, previous_info = runs[k-1]
+            radii = get_predicted_radii(previous_centers, points, previous_membership, config.membership_threshold, previous_info.get("radii"))
+            centers = add_center(previous_centers, points, radii)
+        runs[k] = fit_batched(np.array(centers, dtype=config.dtype)[np.newaxis], np_points, np.array([m], dtype=config.dtype), config)[0]
+        scores[k] = get_validity(config.validity, runs[k][0], points, runs[k][1], m, runs[k][2].get("radii"))
+
+    best = min(scores, key=scores.get)
+    centers, membership_matrix, info = runs[best]
+    info["sweep_iterations"] = sum(run_info["iterations"] for _, _, run_info in runs.values())
+    info["k_scores"] = {str(k): score for k, score in scores.items()}
+    return centers, membership_matrix, info
+
+def estimate_all_radii(centers, points, membership_matrix, threshold):
+    # Radius of every center at once, the mean distance of the points with membership over the threshold weighted
+    # by their membership. A center without any such point gets NaN
+    weights = np.where(membership_matrix >= threshold, membership_matrix, 0)
+    total_weights = weights.sum(axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(total_weights > 0, np.sum(weights * get_ring_distances(centers, points), axis=0) / total_weights, np.nan)
+
+## NOISE FILTER
+
+def get_neighbor_distances(tree, points, neighbors):
+    # Distance of each point to its k-th neighbor in the tree, a point of the tree is the first result of its own query
+    return tree.query(points, k=neighbors+1)[0][:, -1]
+
+def prefilter_points(points, neighbors, factor):
+    # Ring points are packed along their ring and noise is spread over the plane, so noise has far k-th neighbors
+    # The threshold adapts to each cloud: median k-th neighbor distance plus factor robust deviations (scaled MAD)
+    from scipy.spatial import cKDTree
+    tree = cKDTree(points)
+    if len(points) <= neighbors:
+        return np.ones(len(points), dtype=bool), tree, np.inf
+    distances = get_neighbor_distances(tree, points, neighbors)
+    median = np.median(distances)
+    threshold = median + factor * 1.4826 * np.median(np.abs(distances - median))
+    return distances <= threshold, tree, threshold
+
+## ERROR
+
+def get_cost_matrix(centers, rings_centers):
+    # Distance between every predicted center and every real one
+    return np.sqrt(np.sum((np.asarray(centers, dtype=np.float64)[:, np.newaxis, :] - np.asarray(rings_centers, dtype=np.float64)[np.newaxis, :, :])**2, axis=2))
+
+def get_centers_error(cost_matrix, center_ind, ring_ind):
+    # Mean distance between the paired centers
+    return float(np.mean(cost_matrix[center_ind, ring_ind]) / np.sqrt(2000))
+
+def get_predicted_radii(centers, points, membership_matrix, threshold, radii=None):
+    # Engines that fit the radii themselves pass them, the others get them estimated from the memberships
+    if radii is not None:
+        return list(radii)
+    return [float(radius) for radius in estimate_all_radii(centers, points, membership_matrix, threshold)]
+
+def get_radii_error(predicted_radii, rings, center_ind, ring_ind):
+    # Mean relative error of the radii of the paired rings
+    real_radii = np.array([r.radius for r in rings], dtype=np.float64)[ring_ind]
+    return float(np.mean(np.abs(np.asarray(predicted_radii, dtype=np.float64)[center_ind] - real_radii) / real_radii))
 
 def get_error(centers_error, radii_error):
     return centers_error * 0.8 + radii_error * 0.2
 
-def get_total_error(centers, rings, points, membership_matrix):
-    pairs = find_pairs(centers, [r.center for r in rings])
-    return get_centers_error(pairs, centers, rings)*0.8 + get_radii_error(pairs, centers, rings, points, membership_matrix)*0.2
+def score_run(centers, rings, points, membership_matrix, threshold, radii=None):
+    # Everything the result entry needs from a run, computed once: the cost matrix gives both the pairs and the
+    # center error, and all the radii are estimated in one pass over the membership matrix
+    # A run without centers has no pairs and NaN errors, like a run with a center without members
+    if len(centers) == 0:
+        return {"pairs": [], "predicted_radii": [], "centers_error": float("nan"), "radii_error": float("nan"), "tot_error": float("nan")}
+    from scipy.optimize import linear_sum_assignment
+    cost_matrix = get_cost_matrix(centers, [r.center for r in rings])
+    center_ind, ring_ind = linear_sum_assignment(cost_matrix)
+    predicted_radii = get_predicted_radii(centers, points, membership_matrix, threshold, radii)
+    centers_error = get_centers_error(cost_matrix, center_ind, ring_ind)
+    radii_error = get_radii_error(predicted_radii, rings, center_ind, ring_ind)
+    return {"pairs": [[int(i), int(j)] for i, j in zip(center_ind, ring_ind)],
+            "predicted_radii": predicted_radii,
+            "centers_error": centers_error,
+            "radii_error": radii_error,
+            "tot_error": get_error(centers_error, radii_error)}
+
+## CONFIGURATION
+
+SET_TYPES = ["clean", "extends", "collides"]
+PRECISIONS = {"float64": np.float64, "float32": np.float32}
+# fcm clusters the points around centroids, shells (fuzzy c-rings) fits a center and a radius per ring
+# and minibatch is fcm updated from random batches of points, for clouds too large for full iterations
+# hough votes for the rings in a (cx, cy, r) accumulator instead (see hough.py) and ransac fits circles through
+# random triples of points (see ransac.py)
+METHODS = ["fcm", "shells", "minibatch", "hough", "ransac"]
+VALIDITY_INDICES = ["xie-beni", "partition-entropy"]
+
+class DetectionConfig:
+    def __init__(self, fuzziness_range: tuple = (1.05, 2.0), attempts: int = 40, max_iterations: int = 100,
+                 membership_threshold: float = 0.3, data_known: bool = True, num_circles: int = 3,
+                 precision: str = "float64", chunk_size: int | None = None, batched: bool = True, workers: int = 1,
+                 seed: int | None = None, tolerance: float = 1e-6, objective_tolerance: float | None = None,
+                 seeding: str = "uniform", method: str | None = None, noise_distance: float | None = 5.0,
+                 k_range: tuple | None = None, validity: str = "xie-beni", prefilter_neighbors: int | None = None,
+                 prefilter_factor: float = 4.0, batch_size: int = 1024,
+                 radius_range: tuple = (1.0, 50.0), hough_cell: float = 2.0, hough_levels: int = 3,
+                 ransac_hypotheses: int = 4096, inlier_threshold: float = 1.0, ransac_min_support: float = 0.25,
+                 time_budget: float | None = None,
+                 racing: bool = False, racing_budget: int = 5, racing_eta: float = 2.0,
+                 cache_dir: str | None = None, cache_size: int = 2**30, profile: str | None = None,
+                 profile_dir: str = "./profiles"):
+        # Centroid distances make the validity indices favour few rings, so a sweep over k fits shells by default
+        if method is None: method = "shells" if k_range is not None else "fcm"
+        if precision not in PRECISIONS: raise ValueError(f"Unknown precision {precision}")
+        if method not in METHODS: raise ValueError(f"Unknown method {method}")
+        if validity not in VALIDITY_INDICES: raise ValueError(f"Unknown validity index {validity}")
+        if racing and method not in ["fcm", "shells"]: raise ValueError(f"Racing is not available for the {method} method")
+        if racing and not batched: raise ValueError("Racing needs the batched attempts, it is not available with sequential attempts")
+        if racing_eta <= 1: raise ValueError(f"The racing eta must be greater than 1, got {racing_eta}")
+        if k_range is not None and not 2 <= k_range[0] <= k_range[1]: raise ValueError(f"Invalid range of circles {k_range}")
+        if seeding not in SEEDING_STRATEGIES: raise ValueError(f"Unknown seeding strategy {seeding}")
+        if profile is not None and profile not in metrics.PROFILERS: raise ValueError(f"Unknown profiler {profile}")
+
+        self.fuzziness_range = (float(fuzziness_range[0]), float(fuzziness_range[1]))
+        self.attempts = int(attempts)
+        self.max_iterations = int(max_iterations)
+        self.membership_threshold = float(membership_threshold)
+        self.data_known = bool(data_known)
+        self.num_circles = int(num_circles) if num_circles is not None else None
+        self.precision = precision
+        self.dtype = PRECISIONS[precision]
+        self.chunk_size = int(chunk_size) if chunk_size else None
+        self.batched = bool(batched)
+        self.workers = int(workers) if workers else os.cpu_count()
+        # Without a seed every run draws a new one, the seed of each file is kept in its result entry
+        self.seed = int(seed) if seed is not None else int.from_bytes(os.urandom(4), "little")
+        self.tolerance = float(tolerance)
+        self.objective_tolerance = float(objective_tolerance) if objective_tolerance is not None else None
+        self.seeding = seeding
+        self.method = method
+        self.noise_distance = float(noise_distance) if noise_distance is not None else None
+        # In unknown data mode a range of circles replaces num_circles, the number of circles is then chosen by the validity index
+        self.k_range = (int(k_range[0]), int(k_range[1])) if k_range is not None else None
+        self.validity = validity
+        # Points whose k-th neighbor is too far are dropped as noise before the fit, None keeps every point
+        self.prefilter_neighbors = int(prefilter_neighbors) if prefilter_neighbors else None
+        self.prefilter_factor = float(prefilter_factor)
+        self.batch_size = int(batch_size)
+        # Radii searched by the hough and ransac methods, size of its coarse center cells and number of coarse to fine levels
+        self.radius_range = (float(radius_range[0]), float(radius_range[1]))
+        self.hough_cell = float(hough_cell)
+        self.hough_levels = int(hough_levels)
+        # Hypotheses per ring and distance of the inliers of the ransac method, fraction of the inliers of the first ring
+        # a circle needs to be kept as a ring, and seconds it may spend on a cloud
+        self.ransac_hypotheses = int(ransac_hypotheses)
+        self.inlier_threshold = float(inlier_threshold)
+        self.ransac_min_support = float(ransac_min_support)
+        self.time_budget = float(time_budget) if time_budget is not None else None
+        # Successive halving of the attempts: first round budget in iterations, and 1/racing_eta of the attempts kept
+        # after every round (the budget grows by the same factor). For shells the fuzzy c-means stage races
+        self.racing = bool(racing)
+        self.racing_budget = int(racing_budget)
+        self.racing_eta = float(racing_eta)
+        # Directory of the detection cache (see cache.py) and bytes it may take, None detects every cloud
+        self.cache_dir = cache_dir
+        self.cache_size = int(cache_size)
+        # Optional profiler run on every cloud, its output is saved in profile_dir as <set_type>_<cloud>.prof or .tracemalloc
+        self.profile = profile
+        self.profile_dir = profile_dir
 
 ## MAIN LOOP
 
-def detect(dataset_location, output_dir, fuzziness_range, attempts, max_iter, membeership_thress, num_circ, data_known):
-    global DATASESET_LOCATION, OUTPUT_DIRECTORY, FUZZINESS_RANGE, ATTEMPTS, MAX_ITERATIONS, MEMBERSHIP_THRESSHOLD, DATA_KNOWN, NUM_CIRCLES
+def get_file_seed(seed, set_type, filename):
+    # The extension is left out so that the csv and npy copies of a dataset get the same seeds
+    return zlib.crc32(f"{seed}/{set_type}/{os.path.splitext(filename)[0]}".encode())
+
+def detect_job(dataset_location, set_type, filename, seed, config):
+    # (entry, hit, metrics) of a cloud, metrics holds the timers and counters recorded while it was detected
+    metrics.collect()
+    profile_path = f"{config.profile_dir}/{set_type}_{os.path.splitext(filename)[0]}"
+    with metrics.profile(config.profile, profile_path), metrics.timer("cloud"):
+        entry, hit = detect_cached(dataset_location, set_type, filename, seed, config)
+    return entry, hit, metrics.collect()
+
+def detect_cached(dataset_location, set_type, filename, seed, config):
+    # (entry, hit), with a cache directory the entry of a cloud that was already detected with the same settings
+    # is read back instead of fitting it again
+    with metrics.timer("read"):
+        points, rings, noise = read_point_sets(f"{dataset_location}/{set_type}/{filename}", config.data_known)
+    metrics.count("points", len(points))
+    if config.cache_dir is None:
+        return detect_points(points, rings, noise, filename, seed, config), False
+    from Scripts.cache import DetectionCache, get_cache_key
+    cache = DetectionCache(config.cache_dir, config.cache_size)
+    with metrics.timer("cache"):
+        key = get_cache_key(points, rings, seed, config)
+        entry = cache.get(key)
+    if entry is not None:
+        metrics.count("cache_hits")
+        return entry, True
+    entry = detect_points(points, rings, noise, filename, seed, config)
+    with metrics.timer("cache"):
+        metrics.count("cache_bytes", cache.put(key, entry))
+    return entry, False
+
+def detect_points(points, rings, noise, filename, seed, config):
+    random.seed(seed)
+    if config.prefilter_neighbors is not None:
+        with metrics.timer("prefilter"):
+            kept, tree, threshold = prefilter_points(points, config.prefilter_neighbors, config.prefilter_factor)
+            removed_points = points[~kept]
+            points = np.ascontiguousarray(points[kept])
+            prefilter = {"removed": int(len(removed_points)), "threshold": float(threshold)}
+            if config.data_known:
+                # The noise points are in the tree too, so querying them again tells how many of them were removed
+                prefilter["removed_noise"] = int(np.sum(get_neighbor_distances(tree, noise, config.prefilter_neighbors) > threshold)) if len(noise) else 0
+                prefilter["removed_ring_points"] = prefilter["removed"] - prefilter["removed_noise"]
+                prefilter["kept_noise"] = int(len(noise)) - prefilter["removed_noise"]
+
+    with metrics.timer("fit"):
+        if config.method in ["hough", "ransac"]:
+            # A single run and no attempts, the rings are found one by one
+            k = len(rings) if config.data_known else (None if config.k_range is not None else config.num_circles)
+            if config.method == "hough":
+                from Scripts.hough import hough_perform
+                predicted_centers, membership_matrix, convergence = hough_perform(k, points, config)
+            else:
+                from Scripts.ransac import ransac_perform
+                predicted_centers, membership_matrix, convergence = ransac_perform(k, points, config)
+
+        elif config.data_known:
+            if config.batched:
+                runs = alg_perform_batched(len(rings), points, config.attempts, config, rings)
+            else:
+                from tqdm import tqdm
+                runs = [alg_perform(len(rings), points, config) for _ in tqdm(range(config.attempts), desc=f"Predicting {filename}", leave=False)]
+
+        elif config.k_range is not None:
+            predicted_centers, membership_matrix, convergence = alg_sweep(points, config)
+        elif config.racing and config.attempts > 1:
+            # Without labels the attempts race on their objective at a common m, and the lowest one wins
+            runs = alg_perform_batched(config.num_circles, points, config.attempts, config)
+            prototypes = np.array([np.column_stack((c[0], c[2]["radii"])) if "radii" in c[2] else c[0] for c in runs])
+            errors = get_common_objectives(prototypes, np.asarray(points, dtype=np.float64), np.mean(config.fuzziness_range), config.chunk_size)
+            predicted_centers, membership_matrix, convergence = runs[int(np.argmin(errors))]
+        else:
+            predicted_centers, membership_matrix, convergence = alg_perform(config.num_circles, points, config)
+
+    with metrics.timer("scoring"):
+        if config.data_known and config.method in ["hough", "ransac"]:
+            score = score_run(predicted_centers, rings, points, membership_matrix, config.membership_threshold, convergence.get("radii"))
+        elif config.data_known:
+            # The scores of the best attempt are kept for the entry, a NaN error (a center without members) never wins
+            scores = [score_run(c[0], rings, points, c[1], config.membership_threshold, c[2].get("radii")) for c in runs]
+            best = min(range(len(runs)), key=lambda i: scores[i]["tot_error"] if not np.isnan(scores[i]["tot_error"]) else np.inf)
+            (predicted_centers, membership_matrix, convergence), score = runs[best], scores[best]
+        if config.data_known:
+            pairs, centers_error, radii_error, predicted_radii = score["pairs"], score["centers_error"], score["radii_error"], score["predicted_radii"]
+        else:
+            predicted_radii = get_predicted_radii(predicted_centers, points, membership_matrix, config.membership_threshold, convergence.get("radii"))
+    if config.data_known:
+        entry = {
+                "circs_num": len(rings),
+                "circunferences":
+                {
+                    f"{r.circ_no}":
+                    {
+                        "points": r.points,
+                        "center": r.center,
+                        "radius": r.radius
+                    }
+                    for r in rings
+                },
+                "noise": [noise] if len(noise) else [],
+                "pairs": pairs, 
+                "predicted_centers": predicted_centers, 
+                "predicted_radii": [predicted_radii[p[0]] for p in pairs],
+                "membership_matrix" : membership_matrix,
+                "centers_error": centers_error,
+                "radii_error": radii_error,
+                "tot_error": score["tot_error"],
+                "iterations": convergence["iterations"],
+                "center_shift": convergence["center_shift"],
+                "seed": seed
+                }
+        if config.prefilter_neighbors is not None:
+            entry["removed_points"] = removed_points
+            entry["prefilter"] = prefilter
+        if "racing" in convergence:
+            entry["racing"] = convergence["racing"]
+        return entry
+    else:
+        entry = {
+                "circs_num": len(predicted_centers),
+                "points": points,
+                "predicted_centers": predicted_centers, 
+                "predicted_radii": predicted_radii,
+                "membership_matrix" : membership_matrix,
+                "iterations": convergence["iterations"],
+                "center_shift": convergence["center_shift"],
+                "seed": seed
+                }
+        if config.prefilter_neighbors is not None:
+            entry["removed_points"] = removed_points
+            entry["prefilter"] = prefilter
+        if "racing" in convergence:
+            entry["racing"] = convergence["racing"]
+        if config.k_range is not None:
+            entry["k_scores"] = convergence["k_scores"]
+            entry["sweep_iterations"] = convergence["sweep_iterations"]
+        return entry
+
+def run_detection(dataset_location, config, writer=None, report=None):
+    # Without a writer the results dict is returned. With one, every entry is handed to it as soon as it is done
+    # and nothing is kept in memory, the files the writer already holds (from an interrupted run) are skipped
+    # The metrics of every cloud, including the time the writer took to store it, are added to report if given,
+    # and so are the hits, misses and evictions of the cache
+    from tqdm import tqdm
+    done = writer.done() if writer is not None else set()
+    # Every file gets its own seed, so the results do not depend on the number of workers
+    jobs = [(dataset_location, set_type, filename, get_file_seed(config.seed, set_type, filename), config)
+            for set_type in SET_TYPES
+            for filename in os.listdir(f"{dataset_location}/{set_type}") if filename.endswith(DATASET_EXTENSIONS) and (set_type, filename) not in done]
+    results = {set_type: {} for set_type in SET_TYPES}
+    if config.cache_dir is not None:
+        from Scripts.cache import DetectionCache, EVICTION_SLACK
+        cache = DetectionCache(config.cache_dir, config.cache_size)
+    hits, evictions, unevicted = 0, 0, 0
+
+    def collect(set_type, filename, entry, hit, cloud_metrics):
+        nonlocal hits, evictions, unevicted
+        hits += hit
+        if config.cache_dir is not None:
+            # Evicting on every put would scan the whole cache each time, it is done once a slack of bytes was written
+            unevicted += cloud_metrics.counters.get("cache_bytes", 0)
+            if unevicted > config.cache_size * EVICTION_SLACK:
+                evictions += cache.evict()
+                unevicted = 0
+        if writer is None:
+            results[set_type][filename] = entry
+        else:
+            with cloud_metrics.timer("serialization"):
+                writer.add(set_type, filename, entry)
+        if report is not None:
+            report.add(set_type, filename, cloud_metrics)
+
+    if config.workers > 1:
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+        with ProcessPoolExecutor(max_workers=config.workers) as executor:
+            # The json results keep the order of a sequential run, streaming writers take each cloud as soon as it is done
+            if writer is None or not writer.streaming:
+                entries = executor.map(detect_job, *zip(*jobs))
+                for (_, set_type, filename, _, _), job_result in tqdm(zip(jobs, entries), total=len(jobs), desc="Predicting clouds", leave=True):
+                    collect(set_type, filename, *job_result)
+            else:
+                futures = {executor.submit(detect_job, *job): job for job in jobs}
+                for future in tqdm(as_completed(futures), total=len(jobs), desc="Predicting clouds", leave=True):
+                    _, set_type, filename, _, _ = futures.pop(future)
+                    collect(set_type, filename, *future.result())
+    else:
+        for set_type in SET_TYPES:
+            for _, _, filename, file_seed, _ in tqdm([job for job in jobs if job[1] == set_type], desc=f"Predicting clouds of type {set_type}", leave=True):
+                collect(set_type, filename, *detect_job(dataset_location, set_type, filename, file_seed, config))
+
+    if config.cache_dir is not None:
+        evictions += cache.evict()
+        cache.record(hits, len(jobs) - hits, evictions)
+        if report is not None:
+            report.cache = {"hits": hits, "misses": len(jobs) - hits, "evictions": evictions}
+
+    return results if writer is None else None
+
+def save_detection(dataset_location, config, writer, metrics_path=None):
+    # run_detection into writer, which is closed, and its MetricsReport saved in metrics_path (<results>.metrics.json
+    # by default) even when the run is interrupted. A resumed run adds its clouds to the report of the earlier runs
+    # Returns the report and the path it was saved in
+    report = metrics.MetricsReport()
+    metrics_path = metrics_path or f"{writer.path}.metrics.json"
+    resumed = bool(writer.done())
+    try:
+        with report.total.timer("run"):
+            run_detection(dataset_location, config, writer, report)
+    finally:
+        # The json writer serializes every cloud when it is closed
+        with report.total.timer("serialization"):
+            writer.close()
+        if resumed:
+            report.merge_saved(metrics_path)
+        report.save(metrics_path)
+    return report, metrics_path
+
+def detect(dataset_location, output_dir, fuzziness_range, attempts, max_iter, membeership_thress, num_circ, data_known, output_format="json", **options):
+    # Entry point of the GUI, batch jobs should use run_detection directly
+    from PyQt5.QtWidgets import QMessageBox
     try:
-        DATASET_LOCATION = dataset_location
-        OUTPUT_DIRECTORY = output_dir
-        FUZZINESS_RANGE = (float(fuzziness_range.split(",")[0]), float(fuzziness_range.split(",")[1]))
-        ATTEMPTS = int(attempts) if data_known else None
-        MAX_ITERATIONS = int(max_iter)
-        MEMBERSHIP_THRESSHOLD = float(membeership_thress)
-        DATA_KNOWN = data_known
-        NUM_CIRCLES = int(num_circ) if not data_known else None
+        config = DetectionConfig(fuzziness_range=(float(fuzziness_range.split(",")[0]), float(fuzziness_range.split(",")[1])),
+                                 attempts=int(attempts) if data_known else 0,
+                                 max_iterations=int(max_iter),
+                                 membership_threshold=float(membeership_thress),
+                                 data_known=data_known,
+                                 num_circles=int(num_circ) if not data_known and "," not in num_circ else None,
+                                 # A range such as 2,6 lets the detector choose the number of circles
+                                 k_range=(int(num_circ.split(",")[0]), int(num_circ.split(",")[1])) if not data_known and "," in num_circ else None,
+                                 **options)
     except Exception as e:
         message = QMessageBox()
         message.setText(f"Some input was invalid:\n{e}")
         message.exec_()
         return None
-    
-    results = {}
 
     message = QMessageBox()
     message.setText("Progress can be seen in terminal output")
@@ -128,61 +812,11 @@ def detect(dataset_location, output_dir, fuzziness_range, attempts, max_iter, me
 
     start = timeit.default_timer()
 
-    for set_type in ["clean", "extends", "collides"]:
-        results[set_type] = {}
-
-        for filename in tqdm(os.listdir(f"{DATASET_LOCATION}/{set_type}"), desc=f"Predicting clouds of type {set_type}", leave=True):
-            if filename.endswith(".csv"): 
-                df = pd.read_csv(f"{DATASET_LOCATION}/{set_type}/{filename}",header=0, sep=";")
-                points, rings, noise = extract_point_sets(df)
-                if DATA_KNOWN:
-                    predicted_centers, membership_matrix = min([alg_perform(len(rings), points) for _ in tqdm(range(ATTEMPTS), desc=f"Predicting {filename}", leave=False)], key=lambda c: get_total_error(c[0], rings, points, c[1]))
-
-                else:
-                    predicted_centers, membership_matrix = alg_perform(NUM_CIRCLES, points)
-
-                pairs = find_pairs(predicted_centers, [r.center for r in rings]) if DATA_KNOWN else None
-                centers_error = get_centers_error(pairs, predicted_centers, rings) if DATA_KNOWN else None
-                radii_error = get_radii_error(pairs, predicted_centers, rings, points, membership_matrix) if DATA_KNOWN else None
-                if DATA_KNOWN:
-                    results[set_type][filename] =   {
-                                                    "circs_num": len(rings),
-                                                    "circunferences":
-                                                    {
-                                                        f"{r.circ_no}":
-                                                        {
-                                                            "points": r.points,
-                                                            "center": r.center,
-                                                            "radius": r.radius
-                                                        }
-                                                        for r in rings
-                                                    },
-                                                    "noise": noise,
-                                                    "pairs": pairs, 
-                                                    "predicted_centers": predicted_centers, 
-                                                    "predicted_radii": [estimate_radii(predicted_centers[p[0]], points, membership_matrix[:, p[0]]) for p in pairs],
-                                                    "membership_matrix" : membership_matrix.tolist(),
-                                                    "centers_error": centers_error,
-                                                    "radii_error": radii_error,
-                                                    "tot_error": get_error(centers_error, radii_error)
-                                                    }
-                else:
-                    results[set_type][filename] =   {
-                                                    "circs_num": NUM_CIRCLES,
-                                                    "points": points,
-                                                    "predicted_centers": predicted_centers, 
-                                                    "predicted_radii": [estimate_radii(predicted_centers[i], points, membership_matrix[:, i]) for i in range(len(predicted_centers))],
-                                                    "membership_matrix" : membership_matrix.tolist()
-                                                    }
-
-    current_moment = datetime.datetime.now()
-    if not os.path.exists(f"{OUTPUT_DIRECTORY}"):
-                os.makedirs(f"{OUTPUT_DIRECTORY}")
-    with open(f"{OUTPUT_DIRECTORY}/results_{current_moment}.json", 'w') as outfile:
-        json.dump(results, outfile)
+    writer = get_writer(output_dir, output_format)
+    save_detection(dataset_location, config, writer)
 
     message.destroy()
 
     message = QMessageBox()
-    message.setText(f"Success!\nResults saved in {OUTPUT_DIRECTORY}/results_{current_moment}.json\nTook {(timeit.default_timer()-start):.2f} seconds")
+    message.setText(f"Success!\nResults saved in {writer.path}\nTook {(timeit.default_timer()-start):.2f} seconds")
     message.exec_()
\ No newline at end of file
@@ -1,115 +1,131 @@
-import random, os
-import pandas as pd
-from math import pi, cos, sin, sqrt
-from PyQt5.QtWidgets import *
-from Scripts.utils import PointsSet
+import os
+import numpy as np
+from Scripts.utils import DATASET_FORMATS, PointsSet, write_point_sets
 
+# Candidate layouts proposed at once by get_layouts
+LAYOUT_BATCH = 1024
+# Instances generated by each job. The seed of a job only depends on the master seed, the set type and the position
+# of the job, so a dataset does not depend on the number of workers
+GENERATION_CHUNK = 100
+SET_DIRECTORIES = {"clean": "clean", "extends": "extends", "collission": "collides"}
 
 # Dataset generation
 
-def get_circunference_points(n, center, rad):
-    points = []
-    for _ in range(n):
-        theta = random.random() * 2 * pi
-        x = center[0] + cos(theta)*rad + (random.random()/10)*rad*RANDOMNESS
-        y = center[1] + sin(theta)*rad + (random.random()/10)*rad*RANDOMNESS
-        points.append((x,y)) if 0<=x<=100 and 0<=y<=100 else _ # We only add those points inside the valid range
-    return points
-    
-def get_circ_parameters():
-    centers = [(random.uniform(0.0, 100.0), random.uniform(0.0, 100.0)) for _ in range(NUM_CIRC)]
-    radii = [random.uniform(*RANGE_RADIUS) for _ in range(NUM_CIRC)]
-    collides = any(any((centers[i][0]-centers[j][0])**2 + (centers[i][1]-centers[j][1])**2 <= (radii[i]+radii[j])**2 for i in range(j+1, NUM_CIRC)) for j in range(NUM_CIRC))
-    extends = any(0>=centers[i][0]-radii[i] or radii[i]+centers[i][0]>=100 or 0>=centers[i][1]-radii[i] or radii[i]+centers[i][1]>=100 for i in range(NUM_CIRC))
+def get_circunference_points(n, center, rad, randomness, rng):
+    # Angles and jitter of every point are drawn at once
+    theta = rng.random(n) * 2 * np.pi
+    jitter = (rng.random((n, 2))/10)*rad*randomness
+    points = np.column_stack((center[0] + np.cos(theta)*rad, center[1] + np.sin(theta)*rad)) + jitter
+    return points[np.all((0<=points) & (points<=100), axis=1)] # We only keep those points inside the valid range
+
+def get_circ_parameters(num_circ, range_radius, rng, batch=1):
+    # Proposes batch candidate layouts, returns their centers (batch, num_circ, 2), radii (batch, num_circ) and whether each one collides and extends
+    centers = rng.uniform(0.0, 100.0, (batch, num_circ, 2))
+    radii = rng.uniform(*range_radius, (batch, num_circ))
+    distances = np.sum((centers[:, :, None, :] - centers[:, None, :, :])**2, axis=-1)
+    overlaps = distances <= (radii[:, :, None] + radii[:, None, :])**2
+    collides = np.any(np.triu(overlaps, k=1), axis=(1, 2))
+    extends = np.any((centers - radii[:, :, None] <= 0) | (centers + radii[:, :, None] >= 100), axis=(1, 2))
     return centers, radii, collides, extends
 
-def get_data(set_type):
-    centers, radii, collides, extends = get_circ_parameters()
-
-    match set_type:
-        case "clean":
-            while(collides or extends): 
-                centers, radii, collides, extends = get_circ_parameters()
-        case "extends":
-            while(collides or not extends):
-                centers, radii, collides, extends = get_circ_parameters()
-        case "collission":
-            while(not collides or extends):
-                centers, radii, collides, extends = get_circ_parameters()
-
-    data = [PointsSet(get_circunference_points(random.randint(*RANGE_POINTS), centers[i], radii[i]), centers[i], radii[i], i+1) for i in range(NUM_CIRC)]
-    '''
-    for i in range(NUM_CIRC):
-        circ_no = i+1 # 0 will be used for noise
-        center = centers[i]
-        rad = radii[i]
-        n = random.randint(*RANGE_POINTS)
-
-        points = get_circunference_points(n, center, rad)
-        circunference = PointsSet(points, center, circ_no)
-        data.append(circunference)
-    '''
-    
+def get_layouts(set_type, count, config, rng):
+    # Rejection sampling in batches, every matching candidate of a batch is kept so a batch can serve several instances
+    layouts = []
+    while len(layouts) < count:
+        centers, radii, collides, extends = get_circ_parameters(config.num_circ, config.range_radius, rng, LAYOUT_BATCH)
+        match set_type:
+            case "clean": valid = ~collides & ~extends
+            case "extends": valid = ~collides & extends
+            case "collission": valid = collides & ~extends
+            case _: raise ValueError(f"Unknown set type {set_type}")
+        layouts.extend(zip(centers[valid], radii[valid]))
+    return layouts[:count]
+
+def get_data(set_type, config, rng, layout=None):
+    centers, radii = layout if layout is not None else get_layouts(set_type, 1, config, rng)[0]
+
+    sizes = rng.integers(config.range_points[0], config.range_points[1], size=config.num_circ, endpoint=True)
+    data = [PointsSet(get_circunference_points(sizes[i], centers[i], radii[i], config.randomness, rng), (float(centers[i][0]), float(centers[i][1])), float(radii[i]), i+1) for i in range(config.num_circ)]
+
     # Add noise
-    n = int(sum([len(c.points) for c in data]) * (NOISE_RATIO)) # Number of total points so far in the dataset * NOISE_RATIO. This gives us the ammount of noise to include in the dataset
-    points = [(random.uniform(0.0, 100.0), random.uniform(0.0, 100.0)) for _ in range(n)]
-    noise = PointsSet(points, None, None, None)
+    n = int(sum([len(c) for c in data]) * (config.noise_ratio)) # Number of total points so far in the dataset * NOISE_RATIO. This gives us the ammount of noise to include in the dataset
+    noise = PointsSet(rng.uniform(0.0, 100.0, (n, 2)), None, None, None)
 
     data.append(noise)
     return data
 
 
+# Configuration
+
+class GeneratorConfig:
+    def __init__(self, num_circ: int = 3, num_images: int = 10, randomness: float = 1.0, range_radius: tuple = (5.0, 15.0),
+                 range_points: tuple = (100, 150), noise_ratio: float = 0.05, known_data: bool = True,
+                 dataset_format: str = "csv", workers: int = 1, seed: int | None = None):
+        if dataset_format not in DATASET_FORMATS: raise ValueError(f"Unknown dataset format {dataset_format}")
+
+        self.num_circ = int(num_circ)
+        self.num_images = int(num_images)
+        self.randomness = float(randomness)
+        self.range_radius = (float(range_radius[0]), float(range_radius[1]))
+        self.range_points = (int(range_points[0]), int(range_points[1]))
+        self.noise_ratio = float(noise_ratio)
+        self.known_data = bool(known_data)
+        self.dataset_format = dataset_format
+        self.workers = int(workers) if workers else os.cpu_count()
+        self.seed = int(seed) if seed is not None else int.from_bytes(os.urandom(4), "little")
+
 # Main function
 
+def get_next_file_number(directory):
+    # Number after the last instance in the directory as to not overwrite previous data
+    numbers = [int(stem) for stem, _ in map(os.path.splitext, os.listdir(directory)) if stem.isdigit()]
+    return max(numbers, default=0) + 1
+
+def generate_chunk(directory, set_type, first, count, seed_sequence, config):
+    # Every instance is written as soon as it is generated, only the layouts of the chunk are kept in memory
+    rng = np.random.default_rng(seed_sequence)
+    for number, layout in enumerate(get_layouts(set_type, count, config, rng), first):
+        write_point_sets(f"{directory}/{number}.{config.dataset_format}", get_data(set_type, config, rng, layout), config.known_data)
+
+def generate_dataset(output, config):
+    set_types = list(SET_DIRECTORIES) if config.num_circ>1 else ["clean", "extends"]
+    # Each job gets its own range of file numbers and its own random stream, spawned from the master seed
+    jobs = []
+    for set_type in set_types:
+        directory = f"{output}/{SET_DIRECTORIES[set_type]}"
+        os.makedirs(directory, exist_ok=True)
+        first = get_next_file_number(directory)
+        for chunk_no, offset in enumerate(range(0, config.num_images, GENERATION_CHUNK)):
+            seed_sequence = np.random.SeedSequence(config.seed, spawn_key=(list(SET_DIRECTORIES).index(set_type), chunk_no))
+            jobs.append((directory, set_type, first+offset, min(GENERATION_CHUNK, config.num_images-offset), seed_sequence, config))
+
+    if config.workers > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=config.workers) as executor:
+            list(executor.map(generate_chunk, *zip(*jobs)))
+    else:
+        for job in jobs:
+            generate_chunk(*job)
+
 def generate(num_circ, num_images, randomness, range_radius, range_points, noise_ratio, output, known_data):
-    global NUM_CIRC, NUM_IMAGES, RANDOMNESS, RANGE_RADIUS, RANGE_POINTS, NOISE_RATIO, OUTPUT, KNOWN_DATA
+    # Entry point of the GUI, batch jobs should use generate_dataset directly
+    from PyQt5.QtWidgets import QMessageBox
     try:
-        NUM_CIRC = int(num_circ)
-        NUM_IMAGES = int(num_images)
-        RANDOMNESS = float(randomness)
-        RANGE_RADIUS = (float(range_radius.split(",")[0]), float(range_radius.split(",")[1]))
-        RANGE_POINTS = (int(range_points.split(",")[0]), int(range_points.split(",")[1]))
-        NOISE_RATIO = float(noise_ratio)
-        OUTPUT = output
-        KNOWN_DATA = known_data
+        config = GeneratorConfig(num_circ=int(num_circ),
+                                 num_images=int(num_images),
+                                 randomness=float(randomness),
+                                 range_radius=(float(range_radius.split(",")[0]), float(range_radius.split(",")[1])),
+                                 range_points=(int(range_points.split(",")[0]), int(range_points.split(",")[1])),
+                                 noise_ratio=float(noise_ratio),
+                                 known_data=known_data)
     except Exception as e:
         message = QMessageBox()
         message.setText(f"Some input was invalid:\n{e}")
         message.exec_()
         return None
 
-    dataset_clean = [get_data(set_type="clean") for _ in range(NUM_IMAGES)]
-    dataset_extend = [get_data(set_type="extends") for _ in range(NUM_IMAGES)]
-    if(NUM_CIRC>1): dataset_collission = [get_data(set_type="collission") for _ in range(NUM_IMAGES)]
-
-    def save_dataset(dataset, set_type):
-        if not os.path.exists(OUTPUT+f"/{set_type}"):
-            os.makedirs(OUTPUT+f"/{set_type}")
-            counter = 1
-        else:
-            # Start counter from the last csv in the directory as to not overwrite previous data
-            counter = sorted([int(x.split(".")[0]) for x in os.listdir(OUTPUT+f"/{set_type}")])[-1]+1
-        for data in dataset:
-            data_frame_list = []
-            for points_set in data:
-                data_frame_list.extend(points_set.unpack()) if KNOWN_DATA else data_frame_list.extend(points_set.points)
-            
-            if KNOWN_DATA:
-                plane_pd = pd.DataFrame(data_frame_list,
-                                        columns=["point_x", "point_y", "center_x", "center_y", "radius", "circ_no"])
-            else:
-                plane_pd = pd.DataFrame(data_frame_list,
-                                        columns=["point_x", "point_y"])
-
-            # We save the data in a csv, in the output folder specified, continue to the next circle
-            plane_pd.to_csv(OUTPUT+f"/{set_type}/{counter}.csv", sep=";", index=False)
-            counter += 1
-
-    save_dataset(dataset_clean, "clean")
-    save_dataset(dataset_extend, "extends")
-    if(NUM_CIRC>1): save_dataset(dataset_collission, "collides")
+    generate_dataset(output, config)
 
     message = QMessageBox()
     message.setText("Success!")
     message.exec_()
-
@@ -0,0 +1,79 @@
+import numpy as np
+from Scripts.detection import choose_rings
+
+# Hough transform engine, an alternative to the fuzzy clustering of detection.py
+# Every point votes for the (cx, cy, r) cells of all the rings that could pass through it. The centers are searched
+# over the whole 0-100 plane, the peaks of the accumulator are the rings, and each one is refined by voting again
+# in a finer grid around it. There are no random restarts, so the same cloud always gives the same rings
+
+HOUGH_ZOOM = 5 # Cells of a refinement level per cell of the previous level, on every axis
+HOUGH_WINDOW = 2 # Cells of the previous level searched around a peak, and ring distance (in cells) of the points that vote
+HOUGH_SUPPRESSION = 3 # Cells around a peak, on every axis, cleared before the next peak is taken
+VOTES_PER_CHUNK = 2**22 # Distances computed at once when voting
+
+def vote(points, x_centers, y_centers, r_min, r_step, n_radii, chunk_size=None):
+    # Accumulator of shape (len(x_centers), len(y_centers), n_radii), each point adds one vote per center cell,
+    # in the radius bin of its distance to the center of the cell
+    cells = np.stack(np.meshgrid(x_centers, y_centers, indexing="ij"), axis=-1).reshape(-1, 2)
+    first_bins = np.arange(len(cells)) * n_radii
+    accumulator = np.zeros(len(cells) * n_radii, dtype=np.int64)
+    chunk_size = max(chunk_size or VOTES_PER_CHUNK // len(cells), 1)
+    for start in range(0, len(points), chunk_size):
+        chunk = points[start:start+chunk_size]
+        distances = np.sqrt(np.sum((chunk[:, np.newaxis, :] - cells[np.newaxis, :, :])**2, axis=2))
+        bins = np.floor((distances - r_min) / r_step).astype(np.int64)
+        valid = (bins >= 0) & (bins < n_radii)
+        accumulator += np.bincount((first_bins + bins)[valid], minlength=len(accumulator))
+    return accumulator.reshape(len(x_centers), len(y_centers), n_radii)
+
+def find_peaks(accumulator, count, suppression):
+    # Greedy non-maximum suppression, up to count (index, votes) pairs with the highest peak first
+    accumulator = accumulator.copy()
+    peaks = []
+    for _ in range(count):
+        index = np.unravel_index(np.argmax(accumulator), accumulator.shape)
+        if accumulator[index] <= 0:
+            break
+        peaks.append((index, float(accumulator[index])))
+        accumulator[tuple(slice(max(i - suppression, 0), i + suppression + 1) for i in index)] = 0
+    return peaks
+
+def refine(points, center, radius, cell, r_step):
+    # Votes again around a ring with cells HOUGH_ZOOM times smaller, only the points close to the ring take part
+    near = points[np.abs(np.sqrt(np.sum((points - center)**2, axis=1)) - radius) <= HOUGH_WINDOW * cell]
+    if len(near) == 0:
+        return center, radius, 0
+    cell, r_step = cell / HOUGH_ZOOM, r_step / HOUGH_ZOOM
+    offsets = np.arange(-HOUGH_WINDOW * HOUGH_ZOOM, HOUGH_WINDOW * HOUGH_ZOOM + 1) * cell
+    r_min = max(radius - (HOUGH_WINDOW * HOUGH_ZOOM + 0.5) * r_step, 0.0)
+    n_radii = 2 * HOUGH_WINDOW * HOUGH_ZOOM + 1
+    accumulator = vote(near, center[0] + offsets, center[1] + offsets, r_min, r_step, n_radii)
+    ((i, j, l), votes), = find_peaks(accumulator, 1, 0)
+    return (center[0] + offsets[i], center[1] + offsets[j]), r_min + (l + 0.5) * r_step, votes
+
+def hough_perform(k, points, config):
+    # k rings, or when k is None every k of config.k_range scored with the validity index of its memberships
+    points = np.asarray(points, dtype=np.float64)
+    cell = config.hough_cell
+    r_step = cell
+    r_min, r_max = config.radius_range
+    n_radii = int(np.ceil((r_max - r_min) / r_step))
+    grid = np.arange(cell / 2, 100.0, cell)
+
+    accumulator = vote(points, grid, grid, r_min, r_step, n_radii, config.chunk_size)
+    # The votes of points that are not on a ring grow with the circumference of the candidate, dividing by sqrt(r)
+    # keeps large circles through scattered points from outranking the rings without favouring the smallest circles
+    accumulator = accumulator / np.sqrt(r_min + (np.arange(n_radii) + 0.5) * r_step)
+    peaks = find_peaks(accumulator, k if k is not None else config.k_range[1], HOUGH_SUPPRESSION)
+    rings = [((grid[i], grid[j]), r_min + (l + 0.5) * r_step, votes) for (i, j, l), votes in peaks]
+
+    # Coarse to fine, every level zooms HOUGH_ZOOM times into the peaks of the previous one
+    shift = 0.0
+    for level in range(1, config.hough_levels):
+        zoom = HOUGH_ZOOM ** (level - 1)
+        refined = [refine(points, center, radius, cell / zoom, r_step / zoom) for center, radius, _ in rings]
+        shift = max((np.hypot(new[0][0] - old[0][0], new[0][1] - old[0][1]) for new, old in zip(refined, rings)), default=0.0)
+        rings = refined
+
+    info = {"iterations": config.hough_levels, "center_shift": float(shift), "votes": [votes for _, _, votes in rings]}
+    return choose_rings([center for center, _, _ in rings], [radius for _, radius, _ in rings], points, k, config, info)
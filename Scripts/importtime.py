@@ -0,0 +1,52 @@
+import os, re, subprocess, sys
+
+# Import-time budget, checked with python -m Scripts.importtime
+# Every module gets a cumulative budget in milliseconds, as reported by python -X importtime,
+# and a list of heavy modules it must not load on import (they are imported on first use instead)
+HEAVY_MODULES = ["pandas", "scipy", "matplotlib", "tkinter", "tqdm"]
+BUDGETS = {
+    "Scripts.detection": (300, HEAVY_MODULES + ["PyQt5"]),
+    "Scripts.generator": (300, HEAVY_MODULES + ["PyQt5"]),
+    "Scripts.analysis": (300, HEAVY_MODULES + ["PyQt5"]),
+    "Scripts.__main__": (50, HEAVY_MODULES + ["PyQt5", "numpy"]),
+    "main": (800, HEAVY_MODULES + ["numpy", "Scripts.detection", "Scripts.generator", "Scripts.analysis", "Scripts.visualize_dataset", "Scripts.visualize_results"]),
+}
+REPEATS = 3
+# A module whose import fails only because one of these is not installed is skipped, any other failure fails the check
+OPTIONAL_GUI_MODULES = ["PyQt5", "tkinter", "_tkinter"]
+
+def measure(module):
+    # Returns the cumulative import time in milliseconds and the set of imported modules, or the last line of the
+    # traceback as a string if the import fails
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=root, capture_output=True, text=True)
+    if process.returncode != 0:
+        return [line for line in process.stderr.splitlines() if not line.startswith("import time:")][-1]
+    times = {}
+    for line in process.stderr.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \|\s+(\S+)", line)
+        if match:
+            times[match.group(2)] = int(match.group(1)) / 1000
+    return times[module], set(times)
+
+def check_budgets():
+    failed = False
+    for module, (budget, forbidden) in BUDGETS.items():
+        measures = [measure(module) for _ in range(REPEATS)]
+        if isinstance(measures[0], str):
+            missing = re.match(r"ModuleNotFoundError: No module named '([^'.]+)", measures[0])
+            if missing and missing.group(1) in OPTIONAL_GUI_MODULES:
+                print(f"{module:<20} skipped, the optional GUI dependency {missing.group(1)} is not installed")
+                continue
+            failed = True
+            print(f"{module:<20} FAILED, it cannot be imported: {measures[0]}")
+            continue
+        elapsed = min(elapsed for elapsed, _ in measures)
+        loaded = sorted(name for name in forbidden if any(imported == name or imported.startswith(f"{name}.") for imported in measures[0][1]))
+        ok = elapsed <= budget and not loaded
+        failed = failed or not ok
+        print(f"{module:<20} {elapsed:8.1f} ms (budget {budget} ms) {'ok' if ok else 'FAILED'}" + (f", loads {', '.join(loaded)}" if loaded else ""))
+    return not failed
+
+if __name__ == "__main__":
+    sys.exit(0 if check_budgets() else 1)
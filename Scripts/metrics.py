@@ -0,0 +1,160 @@
+import contextlib, functools, json, os, time
+
+# Named timers and counters of a detection run
+# Every process records into its own Metrics, detect_job collects it once per cloud and run_detection adds the
+# metrics of every cloud to a MetricsReport, saved as a JSON file with the metrics of each cloud and their totals
+# Recording is a perf_counter call and a dict update, cheap enough to be always on
+
+class Metrics:
+    __slots__ = ("timers", "counters")
+
+    def __init__(self):
+        self.timers = {} # name -> [seconds, calls]
+        self.counters = {}
+
+    def add_time(self, name, seconds):
+        timer = self.timers.get(name)
+        if timer is None:
+            self.timers[name] = [seconds, 1]
+        else:
+            timer[0] += seconds
+            timer[1] += 1
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def merge(self, other):
+        for name, (seconds, calls) in other.timers.items():
+            timer = self.timers.setdefault(name, [0.0, 0])
+            timer[0] += seconds
+            timer[1] += calls
+        for name, value in other.counters.items():
+            self.count(name, value)
+
+    def to_dict(self):
+        return {"timers": {name: {"seconds": seconds, "calls": calls} for name, (seconds, calls) in sorted(self.timers.items())},
+                "counters": dict(sorted(self.counters.items()))}
+
+def metrics_from_dict(data):
+    # Inverse of Metrics.to_dict
+    recorded = Metrics()
+    recorded.timers = {name: [timer["seconds"], timer["calls"]] for name, timer in data["timers"].items()}
+    recorded.counters = dict(data["counters"])
+    return recorded
+
+RECORDER = Metrics()
+
+def timer(name):
+    return RECORDER.timer(name)
+
+def count(name, value=1):
+    RECORDER.count(name, value)
+
+def collect():
+    # Metrics recorded since the last call, the recorder starts again empty
+    global RECORDER
+    recorded, RECORDER = RECORDER, Metrics()
+    return recorded
+
+def instrument(name):
+    # Times every call of an iteration kernel f(prototypes, points, m, ...) and counts its attempts, points and
+    # point to prototype distances, prototypes has shape (attempts, k, ...)
+    def decorator(iteration):
+        @functools.wraps(iteration)
+        def wrapper(prototypes, points, *args, **kwargs):
+            start = time.perf_counter()
+            result = iteration(prototypes, points, *args, **kwargs)
+            RECORDER.add_time(name, time.perf_counter() - start)
+            attempts, k = prototypes.shape[:2]
+            RECORDER.count(f"{name}.attempts", attempts)
+            RECORDER.count(f"{name}.points", len(points))
+            RECORDER.count(f"{name}.distances", attempts * len(points) * k)
+            return result
+        return wrapper
+    return decorator
+
+PROFILERS = ["cprofile", "tracemalloc"]
+
+@contextlib.contextmanager
+def profile(kind, path):
+    # Optional profiling of a block, cProfile stats are saved in <path>.prof and tracemalloc snapshots in <path>.tracemalloc
+    if kind is None:
+        yield
+        return
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    match kind:
+        case "cprofile":
+            import cProfile
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                yield
+            finally:
+                profiler.disable()
+                profiler.dump_stats(f"{path}.prof")
+        case "tracemalloc":
+            import tracemalloc
+            started = not tracemalloc.is_tracing()
+            if started:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            try:
+                yield
+            finally:
+                count("tracemalloc_peak_bytes", tracemalloc.get_traced_memory()[1])
+                tracemalloc.take_snapshot().dump(f"{path}.tracemalloc")
+                if started:
+                    tracemalloc.stop()
+        case _:
+            raise ValueError(f"Unknown profiler {kind}")
+
+SLOWEST_CLOUDS = 10 # Clouds listed in the slowest field of a report
+
+class MetricsReport:
+    def __init__(self):
+        self.clouds = {}
+        self.total = Metrics()
+        self.cache = None # Hits, misses and evictions of the run when it used a cache
+
+    def add(self, set_type, filename, metrics):
+        self.clouds.setdefault(set_type, {})[filename] = metrics
+        self.total.merge(metrics)
+
+    def to_dict(self):
+        durations = [(metrics.timers.get("cloud", [0.0])[0], set_type, filename)
+                     for set_type, clouds in self.clouds.items() for filename, metrics in clouds.items()]
+        return {"total": self.total.to_dict(),
+                "cache": self.cache,
+                "slowest": [{"set_type": set_type, "filename": filename, "seconds": seconds}
+                            for seconds, set_type, filename in sorted(durations, reverse=True)[:SLOWEST_CLOUDS]],
+                "clouds": {set_type: {filename: metrics.to_dict() for filename, metrics in clouds.items()}
+                           for set_type, clouds in self.clouds.items()}}
+
+    def merge_saved(self, path):
+        # Adds the report saved in path by an earlier run over the same results (an interrupted run that is being
+        # resumed), its clouds go first. Nothing is merged when path does not hold a report
+        try:
+            with open(path) as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return
+        clouds = {set_type: {filename: metrics_from_dict(data) for filename, data in saved_clouds.items()}
+                  for set_type, saved_clouds in saved["clouds"].items()}
+        for set_type, added in self.clouds.items():
+            clouds.setdefault(set_type, {}).update(added)
+        self.clouds = clouds
+        self.total.merge(metrics_from_dict(saved["total"]))
+        if saved["cache"] is not None:
+            self.cache = {name: value + (self.cache or {}).get(name, 0) for name, value in saved["cache"].items()}
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=4)
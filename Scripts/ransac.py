@@ -0,0 +1,91 @@
+import random, timeit
+import numpy as np
+from Scripts.detection import choose_rings
+
+# RANSAC engine, an alternative to the fuzzy clustering of detection.py that needs no initial centers
+# Thousands of circles through 3 random points are scored at once by their number of inliers, the best one is
+# refined with an algebraic least squares fit and its inliers are peeled off the cloud before looking for the next ring
+# The peeling stops when a circle has less than ransac_min_support of the inliers of the first ring
+
+RANSAC_BATCH = 1024 # Hypotheses drawn at once
+DISTANCES_PER_CHUNK = 2**22 # Point to hypothesis distances computed at once when counting inliers
+REFINEMENTS = 3 # Least squares fits of a ring, each one over the inliers of the previous fit
+
+def get_circumcircles(a, b, c):
+    # Circles through the rows of a, b and c, collinear triples get a NaN center
+    d = 2 * (a[:, 0]*(b[:, 1] - c[:, 1]) + b[:, 0]*(c[:, 1] - a[:, 1]) + c[:, 0]*(a[:, 1] - b[:, 1]))
+    a2, b2, c2 = np.sum(a**2, axis=1), np.sum(b**2, axis=1), np.sum(c**2, axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        centers = np.column_stack(((a2*(b[:, 1] - c[:, 1]) + b2*(c[:, 1] - a[:, 1]) + c2*(a[:, 1] - b[:, 1])) / d,
+                                   (a2*(c[:, 0] - b[:, 0]) + b2*(a[:, 0] - c[:, 0]) + c2*(b[:, 0] - a[:, 0])) / d))
+    return centers, np.sqrt(np.sum((a - centers)**2, axis=1))
+
+def count_inliers(centers, radii, points, threshold):
+    # Points within threshold of each circle, chunked over the circles
+    counts = np.empty(len(centers), dtype=np.int64)
+    chunk_size = max(DISTANCES_PER_CHUNK // max(len(points), 1), 1)
+    for start in range(0, len(centers), chunk_size):
+        distances = np.sqrt(np.sum((points[np.newaxis, :, :] - centers[start:start+chunk_size, np.newaxis, :])**2, axis=2))
+        counts[start:start+chunk_size] = np.sum(np.abs(distances - radii[start:start+chunk_size, np.newaxis]) <= threshold, axis=1)
+    return counts
+
+def fit_circle(points):
+    # Algebraic (Kåsa) fit, x² + y² = a·x + b·y + c solved by least squares
+    a, b, c = np.linalg.lstsq(np.column_stack((points, np.ones(len(points)))), np.sum(points**2, axis=1), rcond=None)[0]
+    return np.array([a / 2, b / 2]), np.sqrt(max(c + a**2 / 4 + b**2 / 4, 0.0))
+
+def find_ring(points, config, rng, deadline):
+    # Best circle of the cloud after at least one batch, up to ransac_hypotheses or the deadline
+    best_center, best_radius, best_count, drawn = None, None, -1, 0
+    while drawn < config.ransac_hypotheses and (drawn == 0 or timeit.default_timer() < deadline):
+        triples = points[rng.integers(0, len(points), (RANSAC_BATCH, 3))]
+        centers, radii = get_circumcircles(triples[:, 0], triples[:, 1], triples[:, 2])
+        valid = np.isfinite(radii) & (config.radius_range[0] <= radii) & (radii <= config.radius_range[1])
+        drawn += RANSAC_BATCH
+        if not valid.any():
+            continue
+        counts = count_inliers(centers[valid], radii[valid], points, config.inlier_threshold)
+        best = np.argmax(counts)
+        if counts[best] > best_count:
+            best_center, best_radius, best_count = centers[valid][best], radii[valid][best], counts[best]
+    return best_center, best_radius, drawn
+
+def ransac_perform(k, points, config):
+    # k rings, or when k is None up to the top of config.k_range, chosen with the validity index
+    points = np.asarray(points, dtype=np.float64)
+    rng = np.random.default_rng(random.getrandbits(32))
+    deadline = timeit.default_timer() + config.time_budget if config.time_budget is not None else np.inf
+
+    centers, radii, inliers, shifts = [], [], [], []
+    remaining = points
+    drawn = 0
+    # Why the peeling stopped: every ring was found, too few points were left, no circle fell in the radius range,
+    # or the best circle had too little support to be a ring (once the rings are gone it would only fit noise)
+    stop = "rings"
+    for _ in range(k if k is not None else config.k_range[1]):
+        if len(remaining) < 3:
+            stop = "points"
+            break
+        center, radius, ring_drawn = find_ring(remaining, config, rng, deadline)
+        drawn += ring_drawn
+        if center is None:
+            stop = "radius_range"
+            break
+        hypothesis = center
+        for _ in range(REFINEMENTS):
+            members = np.abs(np.sqrt(np.sum((remaining - center)**2, axis=1)) - radius) <= config.inlier_threshold
+            if members.sum() < 3:
+                break
+            center, radius = fit_circle(remaining[members])
+        members = np.abs(np.sqrt(np.sum((remaining - center)**2, axis=1)) - radius) <= config.inlier_threshold
+        if inliers and members.sum() < config.ransac_min_support * inliers[0]:
+            stop = "support"
+            break
+        centers.append(center)
+        radii.append(radius)
+        inliers.append(int(members.sum()))
+        shifts.append(float(np.hypot(*(center - hypothesis))))
+        remaining = remaining[~members]
+
+    info = {"iterations": drawn, "center_shift": max(shifts, default=0.0), "inliers": inliers, "stop": stop}
+    return choose_rings(centers, radii, points, k, config, info)
@@ -0,0 +1,229 @@
+import os, json, datetime
+import numpy as np
+from collections.abc import Mapping
+
+# Results are written as a single JSON file, as a JSON lines file with one cloud per line, or as a store directory:
+#   results_<timestamp>/index.jsonl                 scalars and small values of every cloud, one line per cloud
+#   results_<timestamp>/index.json                  the same index as a single object, written once the run is over
+#   results_<timestamp>/<set_type>/<cloud>/*.npy    one file per array (points, membership matrix, ...)
+# The index references every array as {"$npy": "<relative path>"}, readers memory-map them on first access
+# JSON lines files and stores get each cloud as soon as it is done, so an interrupted run can be resumed
+
+FORMATS = ["json", "jsonl", "npy"]
+RECORD_BLOCK = 2**16 # Bytes read at a time when resuming a JSON lines file
+SET_TYPE_PREFIX = '{"set_type": '
+FILENAME_PREFIX = ', "filename": '
+
+def to_serializable(value):
+    # Used as the json default, arrays are written as nested lists
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def pack_arrays(value, store_dir, prefix):
+    # Saves every array of value as a .npy file and returns value with the arrays replaced by their reference
+    if isinstance(value, np.ndarray):
+        path = f"{prefix}.npy"
+        np.save(f"{store_dir}/{path}", np.ascontiguousarray(value))
+        return {"$npy": path}
+    if isinstance(value, dict):
+        return {key: pack_arrays(item, store_dir, f"{prefix}.{key}") for key, item in value.items()}
+    if isinstance(value, (list, tuple)) and any(isinstance(item, (np.ndarray, dict, list, tuple)) for item in value):
+        return [pack_arrays(item, store_dir, f"{prefix}.{i}") for i, item in enumerate(value)]
+    return value
+
+def unpack_arrays(value, store_dir):
+    if isinstance(value, dict):
+        if "$npy" in value:
+            return np.load(f"{store_dir}/{value['$npy']}", mmap_mode="r")
+        return StoredNode(value, store_dir)
+    if isinstance(value, list):
+        return [unpack_arrays(item, store_dir) for item in value]
+    return value
+
+class StoredNode(Mapping):
+    # Read-only view of a part of the index, arrays are only opened when they are accessed
+    def __init__(self, skeleton, store_dir):
+        self.skeleton = skeleton
+        self.store_dir = store_dir
+
+    def __getitem__(self, key):
+        return unpack_arrays(self.skeleton[key], self.store_dir)
+
+    def __iter__(self):
+        return iter(self.skeleton)
+
+    def __len__(self):
+        return len(self.skeleton)
+
+def read_journal(path):
+    # Records of a JSON lines file, a line cut by an interrupted run is ignored
+    results = {}
+    if os.path.isfile(path):
+        with open(path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                results.setdefault(record["set_type"], {})[record["filename"]] = record["entry"]
+    return results
+
+def read_journal_keys(path):
+    # (set_type, filename) of every complete record of a JSON lines file. Records start with these two keys, so only
+    # the first RECORD_BLOCK bytes of a line are parsed and the rest is skipped block by block, never holding a whole line
+    keys = set()
+    if not os.path.isfile(path):
+        return keys
+    with open(path, 'rb') as f:
+        while head := f.readline(RECORD_BLOCK):
+            line = head
+            while not line.endswith(b"\n") and line:
+                line = f.readline(RECORD_BLOCK)
+            if not line:
+                # A line cut by an interrupted run
+                break
+            key = parse_record_key(head.decode("ascii", errors="ignore"))
+            if key is not None:
+                keys.add(key)
+    return keys
+
+def parse_record_key(head):
+    decoder = json.JSONDecoder()
+    try:
+        if not head.startswith(SET_TYPE_PREFIX):
+            return None
+        set_type, end = decoder.raw_decode(head, len(SET_TYPE_PREFIX))
+        if not head.startswith(FILENAME_PREFIX, end):
+            return None
+        filename, _ = decoder.raw_decode(head, end + len(FILENAME_PREFIX))
+    except json.JSONDecodeError:
+        return None
+    return set_type, filename
+
+def open_journal(path):
+    # Drops a trailing partial line before appending to an existing file, the last newline is searched backwards from the end
+    if os.path.isfile(path):
+        with open(path, 'rb+') as f:
+            position = f.seek(0, os.SEEK_END)
+            while position > 0:
+                start = max(0, position - RECORD_BLOCK)
+                f.seek(start)
+                newline = f.read(position - start).rfind(b"\n")
+                if newline != -1:
+                    f.truncate(start + newline + 1)
+                    break
+                position = start
+            else:
+                f.truncate(0)
+    return open(path, 'a')
+
+def append_record(journal, set_type, filename, entry):
+    # set_type and filename are written first, read_journal_keys relies on it
+    journal.write(json.dumps({"set_type": set_type, "filename": filename, "entry": entry}, default=to_serializable) + "\n")
+    journal.flush()
+
+# Writers
+
+class JsonResultsWriter:
+    streaming = False
+
+    def __init__(self, path):
+        self.path = path
+        self.results = {}
+
+    def done(self):
+        return set()
+
+    def add(self, set_type, filename, entry):
+        self.results.setdefault(set_type, {})[filename] = entry
+
+    def close(self):
+        with open(self.path, 'w') as outfile:
+            json.dump(self.results, outfile, default=to_serializable)
+
+class JsonlResultsWriter:
+    streaming = True
+
+    def __init__(self, path):
+        self.path = path
+        self.completed = read_journal_keys(path)
+        self.journal = open_journal(path)
+
+    def done(self):
+        return self.completed
+
+    def add(self, set_type, filename, entry):
+        append_record(self.journal, set_type, filename, entry)
+        self.completed.add((set_type, filename))
+
+    def close(self):
+        self.journal.close()
+
+class NpyResultsWriter:
+    streaming = True
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.index = read_journal(f"{path}/index.jsonl")
+        self.journal = open_journal(f"{path}/index.jsonl")
+
+    def done(self):
+        return {(set_type, filename) for set_type, clouds in self.index.items() for filename in clouds}
+
+    def add(self, set_type, filename, entry):
+        cloud = os.path.splitext(filename)[0]
+        os.makedirs(f"{self.path}/{set_type}/{cloud}", exist_ok=True)
+        skeleton = pack_arrays(entry, self.path, f"{set_type}/{cloud}/cloud")
+        append_record(self.journal, set_type, filename, skeleton)
+        self.index.setdefault(set_type, {})[filename] = skeleton
+
+    def close(self):
+        self.journal.close()
+        with open(f"{self.path}/index.json", 'w') as outfile:
+            json.dump(self.index, outfile, default=to_serializable)
+
+def get_writer(output_dir, output_format="json"):
+    current_moment = datetime.datetime.now()
+    if not os.path.exists(f"{output_dir}"):
+                os.makedirs(f"{output_dir}")
+    match output_format:
+        case "json": return JsonResultsWriter(f"{output_dir}/results_{current_moment}.json")
+        case "jsonl": return JsonlResultsWriter(f"{output_dir}/results_{current_moment}.jsonl")
+        case "npy": return NpyResultsWriter(f"{output_dir}/results_{current_moment}")
+        case _: raise ValueError(f"Unknown results format {output_format}")
+
+def resume_writer(path):
+    # Reopens the output of an interrupted run, the clouds it already holds are reported by done()
+    if os.path.isdir(path):
+        return NpyResultsWriter(path)
+    if path.endswith(".jsonl"):
+        return JsonlResultsWriter(path)
+    raise ValueError(f"Only JSON lines files and store directories can be resumed:\n{path}")
+
+# Readers
+
+def is_results(path):
+    return os.path.isfile(path) or os.path.isfile(f"{path}/index.json") or os.path.isfile(f"{path}/index.jsonl")
+
+def load_results(path):
+    # A JSON file is fully loaded, a store only reads its index and maps each cloud lazily
+    if os.path.isdir(path):
+        # The journal is always up to date, index.json may be missing or older if the run was interrupted
+        if os.path.isfile(f"{path}/index.jsonl"):
+            index = read_journal(f"{path}/index.jsonl")
+        else:
+            with open(f"{path}/index.json") as f:
+                index = json.load(f)
+        return {set_type: StoredNode(clouds, path) for set_type, clouds in index.items()}
+    if path.endswith(".jsonl"):
+        return read_journal(path)
+    with open(path) as f:
+        return json.load(f)
+
+def load_cloud(path, set_type, filename):
+    # Opens a single cloud without loading the rest of the results
+    return load_results(path)[set_type][filename]
@@ -1,8 +1,19 @@
 import math
+import numpy as np
+from Scripts import metrics
+
+COLUMNS = ["point_x", "point_y", "center_x", "center_y", "radius", "circ_no"]
+# Instances are saved as semicolon separated csv files or as .npy arrays with the same columns,
+# the arrays are stored column-major so that every column can be memory-mapped as a contiguous block
+DATASET_FORMATS = ["csv", "npy"]
+DATASET_EXTENSIONS = tuple(f".{dataset_format}" for dataset_format in DATASET_FORMATS)
 
 class PointsSet:
+    # Points are kept as a single (n, 2) float64 array instead of a list of tuples
+    __slots__ = ("points", "center", "radius", "circ_no")
+
     def __init__(self, points, center, radius, circ_no):
-        self.points = points
+        self.points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
         self.center = center
         self.radius = radius
         self.circ_no = circ_no
@@ -14,20 +25,86 @@ class PointsSet:
         circ_no = int(circ_no) if not math.isnan(circ_no) else None
         return PointsSet(points, center, radius, circ_no)
 
+    def from_arrays(xs, ys, center=None, radius=None, circ_no=None):
+        return PointsSet(np.column_stack((xs, ys)), center, radius, circ_no)
+
+    def empty(center=None, radius=None, circ_no=None):
+        return PointsSet(np.empty((0, 2)), center, radius, circ_no)
+
     def add_point(self, point):
-        self.points.append(point)
+        self.add_points([point])
+
+    def add_points(self, points):
+        self.points = np.concatenate((self.points, np.asarray(points, dtype=np.float64).reshape(-1, 2)))
 
     def is_noise(self):
         return self.circ_no is None
 
     def unpack(self):
-        if self.is_noise():
-            return [[p[0], p[1], None, None, None] for p in self.points]
-        else:
-            return [[p[0], p[1], self.center[0], self.center[1], self.radius, self.circ_no] for p in self.points]
+        # Columnar block with the layout in COLUMNS, noise gets NaN in the ring columns
+        block = np.full((len(self.points), len(COLUMNS)), np.nan)
+        block[:, :2] = self.points
+        if not self.is_noise():
+            block[:, 2:] = (self.center[0], self.center[1], self.radius, self.circ_no)
+        return block
+
+    def __len__(self):
+        return len(self.points)
 
     def __str__(self):
         if self.is_noise():
             return f"{len(self.points)} of Noise"
         else:
-            return f"Circunference {self.circ_no} has {len(self.points)} points and center in {self.center}"
\ No newline at end of file
+            return f"Circunference {self.circ_no} has {len(self.points)} points and center in {self.center}"
+
+# Loading
+
+def split_point_block(block, known_data):
+    # block has one row per point and the columns in COLUMNS (only the first two when the data is not known)
+    points = np.ascontiguousarray(block[:, :2], dtype=np.float64)
+    if not known_data:
+        return points, None, None
+
+    circ_no = block[:, 5]
+    is_noise = np.isnan(circ_no)
+    noise = np.ascontiguousarray(points[is_noise])
+
+    # A stable sort groups the rows of each ring while keeping their order in the file
+    ring_rows = np.flatnonzero(~is_noise)
+    ring_rows = ring_rows[np.argsort(circ_no[ring_rows], kind="stable")]
+    circ_nos, starts = np.unique(circ_no[ring_rows], return_index=True)
+    ring_meta = block[ring_rows[starts], 2:5]
+    rings = [PointsSet(ring_points, (center_x, center_y), radius, int(no))
+             for ring_points, (center_x, center_y, radius), no in zip(np.split(points[ring_rows], starts[1:]), ring_meta, circ_nos)]
+
+    return points, rings, noise
+
+def extract_point_sets(df, known_data):
+    columns = COLUMNS if known_data else COLUMNS[:2]
+    return split_point_block(df[columns].to_numpy(dtype=np.float64), known_data)
+
+def read_point_sets(path, known_data):
+    # The file is timed as parse and the split of its rows into rings and noise as extract (see metrics.py)
+    if path.endswith(".npy"):
+        # Memory-mapped, no text is parsed and only the columns that are used get read (during extract)
+        with metrics.timer("parse"):
+            block = np.load(path, mmap_mode="r")
+        with metrics.timer("extract"):
+            return split_point_block(block, known_data)
+    with metrics.timer("parse"):
+        # The first csv of a process also pays for the import of pandas
+        import pandas as pd
+        df = pd.read_csv(path, header=0, sep=";")
+    with metrics.timer("extract"):
+        return extract_point_sets(df, known_data)
+
+def write_point_sets(path, data, known_data):
+    # data is the list of PointsSet of an instance, the format is chosen by the extension of path
+    block = np.concatenate([points_set.unpack() for points_set in data])
+    if not known_data:
+        block = block[:, :2]
+    if path.endswith(".npy"):
+        np.save(path, np.asfortranarray(block))
+    else:
+        import pandas as pd
+        pd.DataFrame(block, columns=COLUMNS[:block.shape[1]]).to_csv(path, sep=";", index=False)
\ No newline at end of file
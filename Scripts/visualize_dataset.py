@@ -1,5 +1,5 @@
-import math, random, os
-import pandas as pd
+import random, os
+import numpy as np
 from tkinter import *
 from PyQt5.QtWidgets import *
 from matplotlib import *
@@ -8,23 +8,7 @@ from matplotlib.backends.backend_tkagg import (
     FigureCanvasTkAgg,
     NavigationToolbar2Tk
 )
-from Scripts.utils import PointsSet
-
-def extract_point_sets(df):
-    data = []
-    if KNOWN_DATA:
-        for _, row in df.iterrows():
-            existing_ps = next(filter(lambda ps: ps.circ_no==row.circ_no if not math.isnan(row.circ_no) else ps.circ_no is None, data), None)
-            if existing_ps is not None:
-                existing_ps.add_point((row.point_x, row.point_y))
-            else:
-                data.append(PointsSet.parse([(row.point_x, row.point_y)], (row.center_x, row.center_y), row.radius, row.circ_no))
-        
-    else:
-        for _, row in df.iterrows():
-            data.append(PointsSet.parse([(row.point_x, row.point_y)], math.nan, math.nan, math.nan))
-
-    return data
+from Scripts.utils import DATASET_EXTENSIONS, PointsSet, read_point_sets
 
 # Main loop
 
@@ -34,11 +18,9 @@ class DataSetVis():
 
     def visualize(self, set_type):
         def plot_data(data):
-            points = []
+            points = np.concatenate([points_set.points for points_set in data])
             c = []
             for points_set in data:
-                points.extend(points_set.points)
-                
                 # We set the color for the set, making sure its different for each set
                 set_color = random.uniform(0, 100)
                 while(set_color in c):
@@ -47,7 +29,7 @@ class DataSetVis():
 
             fig = Figure(figsize=(5, 5), dpi=100)
             ax = fig.add_subplot()
-            ax.scatter(*zip(*points), s=10, c=c) if KNOWN_DATA else ax.scatter(*zip(*points), s=10)
+            ax.scatter(points[:, 0], points[:, 1], s=10, c=c) if KNOWN_DATA else ax.scatter(points[:, 0], points[:, 1], s=10)
             ax.set(xlim=(0, 100), ylim=(0, 100))
             ax.set_aspect('equal')
             
@@ -84,9 +66,9 @@ class DataSetVis():
                     visualize_window.resizable(False, False)
                     visualize_window.title(f"{set_type} - {filename}")
 
-                    if filename.endswith(".csv"): 
-                        df = pd.read_csv(f"{DATASET_LOCATION}/{set_type}/{filename}",header=0, sep=";")
-                        data = extract_point_sets(df)
+                    if filename.endswith(DATASET_EXTENSIONS): 
+                        points, rings, noise = read_point_sets(f"{DATASET_LOCATION}/{set_type}/{filename}", KNOWN_DATA)
+                        data = rings + [PointsSet(noise, None, None, None)] if KNOWN_DATA else [PointsSet(points, None, None, None)]
                         plot_data(data)
                         Button(visualize_window, text="Next", command= lambda: next(i)).pack(side=RIGHT, expand=True)
                         Button(visualize_window, text="Next Type", command=next_set_type).pack(side=RIGHT, expand=True)
@@ -1,50 +1,15 @@
-import math, random, os, json
+import random
 import matplotlib.pyplot as plt
 from tkinter import *
 from PyQt5.QtWidgets import *
 from matplotlib import *
 from matplotlib.figure import Figure
+from Scripts.results_io import is_results, load_results
 from matplotlib.backends.backend_tkagg import (
     FigureCanvasTkAgg,
     NavigationToolbar2Tk
 )
 
-class PointsSet:
-    def __init__(self, points, center, radius, circ_no):
-        self.points = points
-        self.center = center if not math.isnan(circ_no) else None
-        self.radius = radius if not math.isnan(circ_no) else None
-        self.circ_no = int(circ_no) if not math.isnan(circ_no) else None
-
-    def add_point(self, point):
-        self.points.append(point)
-
-    def is_noise(self):
-        return self.circ_no is None
-
-    def unpack(self):
-        if self.is_noise():
-            return [[p[0], p[1], None, None, None] for p in self.points]
-        else:
-            return [[p[0], p[1], self.center[0], self.center[1], self.radius, self.circ_no] for p in self.points]
-
-    def __str__(self):
-        if self.is_noise():
-            return f"{len(self.points)} of Noise"
-        else:
-            return f"Circunference {self.circ_no} has {len(self.points)} points and center in {self.center}"
-
-def extract_point_sets(df):
-    data = []
-    for index, row in df.iterrows():
-        
-        existing_ps = next(filter(lambda ps: ps.circ_no==row.circ_no if not math.isnan(row.circ_no) else ps.circ_no is None, data), None)
-        if existing_ps is not None:
-            existing_ps.add_point((row.point_x, row.point_y))
-        else:
-            data.append(PointsSet([(row.point_x, row.point_y)], (row.center_x, row.center_y), row.radius, row.circ_no))
-    return data
-
 # Main function
 class ResultsVis():
     def __init__(self, current_set_type):
@@ -139,14 +104,13 @@ class ResultsVis():
 def init_res_vis(results_path, known_data):
     global RESULTS, KNOWN_DATA
 
-    if not os.path.isfile(f"{results_path}"):
+    if not is_results(f"{results_path}"):
         message = QMessageBox()
         message.setText(f"The provided file does not exist:\n{results_path}")
         message.exec_()
         return None
 
-    f = open(f"{results_path}")
-    RESULTS = json.load(f)
+    RESULTS = load_results(f"{results_path}")
     KNOWN_DATA = known_data
     res_vis = ResultsVis("clean")
     res_vis.visualize("clean")
\ No newline at end of file
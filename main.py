@@ -1,11 +1,10 @@
-import sys
+import sys, importlib
 from PyQt5.QtWidgets import *
 from PyQt5 import uic
-from Scripts.generator import * 
-from Scripts.detection import *
-from Scripts.visualize_dataset import *
-from Scripts.visualize_results import *
-from Scripts.analysis import *
+
+def run_script(module, function, *args):
+    # Scripts are imported the first time their button is used, so the window shows up before numpy, pandas or matplotlib load
+    return getattr(importlib.import_module(f"Scripts.{module}"), function)(*args)
 
 class ClusteringRingsGUI(QMainWindow):
     def __init__(self):
@@ -13,7 +12,7 @@ class ClusteringRingsGUI(QMainWindow):
         uic.loadUi("clustering_rings.ui", self)
         self.setFixedSize(self.size())
 
-        self.generate_button.clicked.connect(lambda: generate(self.num_circs_input.text().strip(), 
+        self.generate_button.clicked.connect(lambda: run_script("generator", "generate", self.num_circs_input.text().strip(), 
                                                               self.num_instances_input.text().strip(),
                                                               self.randomness_input.text().strip(),
                                                               self.range_radius_input.text().strip(),
@@ -21,7 +20,7 @@ class ClusteringRingsGUI(QMainWindow):
                                                               self.noise_ratio_input.text().strip(),
                                                               self.dataset_input_generation.text().strip(),
                                                               self.known_input_generation.isChecked()))
-        self.detect_button.clicked.connect(lambda: detect(self.dataset_input_detection.text().strip(), 
+        self.detect_button.clicked.connect(lambda: run_script("detection", "detect", self.dataset_input_detection.text().strip(), 
                                                             self.results_input_detection.text().strip(),
                                                             self.fuzziness_input.text().strip(),
                                                             self.attempts_input.text().strip(),
@@ -30,11 +29,11 @@ class ClusteringRingsGUI(QMainWindow):
                                                             self.num_circs_input_detection.text().strip(), 
                                                             self.known_input_detection.isChecked()))
         
-        self.vis_dataset_button.clicked.connect(lambda: init_vis(self.dataset_input_visuals.text().strip(),
+        self.vis_dataset_button.clicked.connect(lambda: run_script("visualize_dataset", "init_vis", self.dataset_input_visuals.text().strip(),
                                                             self.known_input_visuals_dat.isChecked()))
-        self.vis_results_button.clicked.connect(lambda: init_res_vis(self.results_input_visuals.text().strip(),
+        self.vis_results_button.clicked.connect(lambda: run_script("visualize_results", "init_res_vis", self.results_input_visuals.text().strip(),
                                                             self.known_input_visuals_res.isChecked()))
-        self.stats_results_button.clicked.connect(lambda: show_accuracy(self.results_input_visuals.text().strip(),
+        self.stats_results_button.clicked.connect(lambda: run_script("analysis", "show_accuracy", self.results_input_visuals.text().strip(),
                                                             self.known_input_visuals_res.isChecked()))
 
 if __name__=="__main__":